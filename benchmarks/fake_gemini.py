@@ -0,0 +1,55 @@
+"""Stand-in for the Gemini generateContent endpoint.
+
+Answers every request after a configurable delay with a product list in the
+same fenced-JSON shape the real prompt asks for, built from the seed
+vocabulary. Point the app at it with GEMINI_URL.
+
+    FAKE_GEMINI_LATENCY_MS=800 uvicorn benchmarks.fake_gemini:app --port 8787
+"""
+
+import asyncio
+import json
+import os
+import random
+import zlib
+
+from fastapi import FastAPI, Request, Response
+
+from benchmarks.fixtures import BRANDS, KINDS, VARIANTS
+
+FAKE_GEMINI_LATENCY_MS = float(os.getenv("FAKE_GEMINI_LATENCY_MS", "800"))
+FAKE_GEMINI_JITTER_MS = float(os.getenv("FAKE_GEMINI_JITTER_MS", "200"))
+# Share of requests answered with a 503, to exercise the client's retries
+FAKE_GEMINI_ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0"))
+
+app = FastAPI()
+
+
+def fake_products(rng: random.Random) -> list[dict]:
+    products = []
+    for _ in range(rng.randint(1, 3)):
+        brand, kind, variant = rng.choice(BRANDS), rng.choice(KINDS), rng.choice(VARIANTS)
+        name = f"{brand} {kind} {variant}"
+        products.append(
+            {
+                "name_original": name,
+                "name_indonesian": name,
+                "name_english": name,
+                "keywords": [f"{brand} {kind}", kind, brand, name],
+                "count": 1,
+            }
+        )
+    return products
+
+
+@app.post("/{path:path}")
+async def generate_content(request: Request, path: str):
+    body = await request.body()
+    delay = FAKE_GEMINI_LATENCY_MS + random.uniform(-1, 1) * FAKE_GEMINI_JITTER_MS
+    await asyncio.sleep(max(delay, 0) / 1000)
+    if random.random() < FAKE_GEMINI_ERROR_RATE:
+        return Response(status_code=503)
+    # Same image, same answer, like the real model at low temperature
+    rng = random.Random(zlib.crc32(body))
+    text = f"```json\n{json.dumps(fake_products(rng))}\n```"
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
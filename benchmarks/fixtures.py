@@ -0,0 +1,54 @@
+import itertools
+import random
+
+# Small grocery vocabulary shared by the seed data, the fake model and the
+# load generator, so searched and predicted keywords actually hit products
+BRANDS = [
+    "indomie", "sedaap", "abc", "masako", "royco", "sania", "bimoli", "aqua",
+    "sosro", "ultra", "frisian flag", "kapal api", "good day", "chitato",
+    "qtela", "oreo", "roma", "khong guan", "pocari", "lifebuoy",
+]
+KINDS = [
+    "mie goreng", "mie kuah", "kecap manis", "saus sambal", "minyak goreng",
+    "susu coklat", "kopi susu", "teh melati", "biskuit kelapa",
+    "keripik kentang", "air mineral", "gula pasir", "beras", "sabun mandi",
+    "shampoo", "pasta gigi",
+]
+VARIANTS = [
+    "original", "pedas", "ayam bawang", "soto", "jumbo", "mini", "500ml",
+    "1l", "250g", "1kg",
+]
+CATEGORIES = ["Makanan", "Minuman", "Bumbu", "Snack", "Kebersihan"]
+UNITS = ["pcs", "pack", "botol", "kg", "dus"]
+
+
+def product_names(count: int, seed: int = 0) -> list[str]:
+    """`count` unique product names, the same ones for the same seed."""
+    combos = [
+        f"{brand} {kind} {variant}"
+        for brand, kind, variant in itertools.product(BRANDS, KINDS, VARIANTS)
+    ]
+    random.Random(seed).shuffle(combos)
+    names = combos[:count]
+    for i in range(count - len(names)):
+        names.append(f"{combos[i % len(combos)]} {i // len(combos) + 2}")
+    return names
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Drop or swap one letter, like a hurried search would."""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    if rng.random() < 0.5:
+        return word[:i] + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def search_keyword(rng: random.Random, typo_rate: float = 0.2) -> str:
+    keyword = rng.choice(
+        [rng.choice(BRANDS), rng.choice(KINDS), f"{rng.choice(BRANDS)} {rng.choice(KINDS)}"]
+    )
+    if rng.random() < typo_rate:
+        keyword = misspell(keyword, rng)
+    return keyword
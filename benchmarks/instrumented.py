@@ -0,0 +1,58 @@
+"""`main:app` with per-request database query counting, for the benchmarks.
+
+Every SQL statement run while a request is being handled is counted and
+returned in the X-Bench-DB-Queries response header. Background work such
+as the catalog refresher runs outside any request and is not counted.
+
+    uvicorn benchmarks.instrumented:app
+"""
+
+import contextvars
+
+from sqlalchemy import event
+
+from db.database import async_engine_local_db, engine_local_db
+from main import app
+
+DB_QUERIES_HEADER = b"x-bench-db-queries"
+
+_query_count: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "bench_query_count", default=None
+)
+
+
+def _count_query(*args):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+for engine in (engine_local_db, async_engine_local_db.sync_engine):
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class QueryCountMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        counter = [0]
+        token = _query_count.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (DB_QUERIES_HEADER, str(counter[0]).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _query_count.reset(token)
+
+
+app.add_middleware(QueryCountMiddleware)
@@ -0,0 +1,415 @@
+"""Closed-loop load test of the app at rising concurrency.
+
+Each virtual user keeps its own session and loops over a weighted mix of
+endpoints. Per endpoint and concurrency level the run records latency
+percentiles, throughput, errors and database queries per request (from
+the instrumented app). The results are written as JSON so runs can be diffed.
+
+`upload` sends a freshly generated image every time, so it always misses
+the prediction cache. `upload_repeat` cycles through a small fixed set
+(--upload-images) and, once warmed up, measures cache hits on their own.
+
+    python -m benchmarks.seed --reset
+    python -m benchmarks.loadtest --boot --concurrency 1,8,32 --output bench.json
+    python -m benchmarks.loadtest --boot --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import functools
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+import httpx
+from PIL import Image
+
+from benchmarks.fixtures import search_keyword
+
+DEFAULT_MIX = "search=55,root=10,cart_add=15,cart_item=12,upload=8"
+SESSION_COOKIE_NAME = "ikmimart_session_id"
+# Set by benchmarks.instrumented; absent when targeting a plain main:app
+DB_QUERIES_HEADER = "x-bench-db-queries"
+READY_TIMEOUT_SECONDS = 60
+IMAGE_SIZE = (1024, 768)
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    db_queries: int = 0
+    db_queries_seen: int = 0
+
+    def record(self, latency: float, ok: bool, db_queries: int | None):
+        self.latencies.append(latency)
+        if not ok:
+            self.errors += 1
+        if db_queries is not None:
+            self.db_queries += db_queries
+            self.db_queries_seen += 1
+
+    def merge(self, other: "EndpointStats"):
+        self.latencies += other.latencies
+        self.errors += other.errors
+        self.db_queries += other.db_queries
+        self.db_queries_seen += other.db_queries_seen
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 2) if latencies else None,
+            "db_queries_per_request": (
+                round(self.db_queries / self.db_queries_seen, 2)
+                if self.db_queries_seen
+                else None
+            ),
+        }
+
+
+def percentile(sorted_values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[rank], 2)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in VirtualUser.ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r}, expected one of {VirtualUser.ENDPOINTS}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+@functools.cache
+def _noise() -> Image.Image:
+    # Camera-like grain for realistic JPEG sizes; slow to generate, so shared
+    return Image.effect_noise(IMAGE_SIZE, 50)
+
+
+def make_image(seed: int) -> bytes:
+    """A camera-sized JPEG whose perceptual hash is effectively random.
+
+    The coarse shape comes from a random 9x8 grid, the same resolution the
+    prediction cache hashes at, so two images are near-duplicates only by
+    a one-in-billions chance.
+    """
+    rng = random.Random(seed)
+    grid = Image.frombytes("L", (9, 8), bytes(rng.randrange(256) for _ in range(72)))
+    shape = grid.resize(IMAGE_SIZE, Image.Resampling.BILINEAR)
+    img = Image.blend(shape, _noise(), 0.3).convert("RGB")
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+def make_images(count: int, seed: int = 0) -> list[bytes]:
+    """A fixed set of distinct images for `upload_repeat`."""
+    rng = random.Random(seed)
+    return [make_image(rng.getrandbits(64)) for _ in range(count)]
+
+
+class VirtualUser:
+    ENDPOINTS = ("search", "root", "cart_add", "cart_item", "upload", "upload_repeat")
+
+    def __init__(
+        self, client: httpx.AsyncClient, rng: random.Random, product_count: int, images: list[bytes]
+    ):
+        self.client = client
+        self.rng = rng
+        self.product_count = product_count
+        self.images = images
+        self.session: str | None = None
+        self.cart: set[int] = set()
+        self.next_image: bytes | None = None
+
+    def _headers(self) -> dict[str, str]:
+        headers = {
+            "HX-Request": "true",
+            "HX-Current-URL": str(self.client.base_url),
+            "Accept-Encoding": "gzip, br",
+        }
+        # Sent by hand, so the cookie deletion on "/" does not leave the
+        # following cart requests without a session
+        if self.session:
+            headers["Cookie"] = f"{SESSION_COOKIE_NAME}={self.session}"
+        return headers
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        response = await self.client.request(method, url, headers=self._headers(), **kwargs)
+        session = response.cookies.get(SESSION_COOKIE_NAME)
+        if session:
+            self.session = session
+        return response
+
+    async def search(self) -> httpx.Response:
+        return await self.request("GET", "/search", params={"q": search_keyword(self.rng)})
+
+    async def root(self) -> httpx.Response:
+        return await self.client.get("/")
+
+    async def cart_add(self) -> httpx.Response:
+        product_id = self.rng.randint(1, self.product_count)
+        response = await self.request("POST", "/cart/add", params={"product_id": product_id})
+        if response.status_code == 200:
+            self.cart.add(product_id)
+        return response
+
+    async def cart_item(self) -> httpx.Response:
+        product_id = self.rng.choice(sorted(self.cart))
+        action = self.rng.choice(("increase", "increase", "decrease"))
+        return await self.request(
+            "POST", f"/cart/item/{product_id}", params={"action": action}
+        )
+
+    async def prepare_upload(self):
+        # Generated off the clock and off the event loop, before the request is timed
+        self.next_image = await asyncio.to_thread(make_image, self.rng.getrandbits(64))
+
+    async def upload(self) -> httpx.Response:
+        return await self._upload(self.next_image)
+
+    async def upload_repeat(self) -> httpx.Response:
+        return await self._upload(self.rng.choice(self.images))
+
+    async def _upload(self, image: bytes) -> httpx.Response:
+        return await self.request(
+            "POST", "/upload", files={"file": ("photo.jpg", image, "image/jpeg")}
+        )
+
+    async def run(
+        self, weights: dict[str, float], deadline: float, stats: dict[str, EndpointStats]
+    ):
+        names, weight_values = list(weights), list(weights.values())
+        while self.session is None and time.perf_counter() < deadline:
+            # Every user starts with a search, which is what creates the session
+            try:
+                await self.search()
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights=weight_values)[0]
+            if name == "cart_item" and not self.cart:
+                # Nothing to change yet; the add is timed as what it is
+                name = "cart_add"
+            prepare = getattr(self, f"prepare_{name}", None)
+            if prepare is not None:
+                await prepare()
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, name)()
+                ok = response.status_code < 400
+                db_queries = response.headers.get(DB_QUERIES_HEADER)
+            except httpx.HTTPError:
+                ok, db_queries = False, None
+            latency = (time.perf_counter() - start) * 1000
+            stats[name].record(latency, ok, int(db_queries) if db_queries else None)
+
+
+async def run_stage(
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    weights: dict[str, float],
+    product_count: int,
+    images: list[bytes],
+    seed: int,
+) -> dict:
+    stat_names = list(weights)
+    if "cart_item" in weights and "cart_add" not in weights:
+        # cart_item falls back to cart_add while a user's cart is empty
+        stat_names.append("cart_add")
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # One client per user for its own cookies, all sharing one connection pool
+    async with httpx.AsyncHTTPTransport(limits=limits) as transport:
+        per_user = []
+        users = []
+        for i in range(concurrency):
+            client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60)
+            per_user.append({name: EndpointStats() for name in stat_names})
+            users.append(VirtualUser(client, random.Random(seed * 10007 + i), product_count, images))
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(
+            *(user.run(weights, deadline, stats) for user, stats in zip(users, per_user))
+        )
+        elapsed = time.perf_counter() - started
+
+    endpoints = {name: EndpointStats() for name in stat_names}
+    total = EndpointStats()
+    for stats in per_user:
+        for name, endpoint_stats in stats.items():
+            endpoints[name].merge(endpoint_stats)
+            total.merge(endpoint_stats)
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "endpoints": {name: s.summary(elapsed) for name, s in endpoints.items()},
+        "total": total.summary(elapsed),
+    }
+
+
+def start_server(module: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", module,
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        env=env,
+    )
+
+
+async def wait_ready(base_url: str, process: subprocess.Popen | None = None):
+    deadline = time.perf_counter() + READY_TIMEOUT_SECONDS
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise SystemExit(f"Server at {base_url} exited with {process.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"Server at {base_url} did not come up in {READY_TIMEOUT_SECONDS}s")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(stages: list[dict], baseline: dict | None = None):
+    base = {}
+    if baseline is not None:
+        base = {stage["concurrency"]: stage for stage in baseline["stages"]}
+    header = f"{'conc':>5} {'endpoint':<10} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'dbq':>5}"
+    print(header)
+    print("-" * len(header))
+    for stage in stages:
+        rows = {**stage["endpoints"], "total": stage["total"]}
+        for name, s in rows.items():
+            p50, p95, p99, dbq = (
+                "-" if s[key] is None else s[key]
+                for key in ("p50_ms", "p95_ms", "p99_ms", "db_queries_per_request")
+            )
+            line = (
+                f"{stage['concurrency']:>5} {name:<10} {s['requests']:>7} {s['errors']:>5} "
+                f"{s['rps']:>8} {p50:>8} {p95:>8} {p99:>8} {dbq:>5}"
+            )
+            previous = base.get(stage["concurrency"])
+            if previous is not None:
+                previous = {**previous["endpoints"], "total": previous["total"]}.get(name)
+            if previous and previous.get("p95_ms") and s["p95_ms"]:
+                line += f"  p95 {s['p95_ms'] / previous['p95_ms'] - 1:+.0%}"
+            print(line)
+
+
+async def main(args):
+    weights = parse_mix(args.mix)
+    images = make_images(args.upload_images if "upload_repeat" in weights else 0, args.seed)
+    processes = []
+    base_url = args.base_url
+    try:
+        if args.boot:
+            env = {
+                **os.environ,
+                "FAKE_GEMINI_LATENCY_MS": str(args.gemini_latency_ms),
+                "FAKE_GEMINI_JITTER_MS": str(args.gemini_jitter_ms),
+                "GEMINI_URL": f"http://127.0.0.1:{args.gemini_port}/generate",
+                "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "bench",
+                "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO"),
+            }
+            gemini = start_server("benchmarks.fake_gemini:app", args.gemini_port, env)
+            processes.append(gemini)
+            app = start_server("benchmarks.instrumented:app", args.port, env, args.workers)
+            processes.append(app)
+            base_url = f"http://127.0.0.1:{args.port}"
+            await wait_ready(base_url, app)
+
+        stages = []
+        for concurrency in args.concurrency:
+            stage = await run_stage(
+                base_url, concurrency, args.duration, weights,
+                args.products, images, args.seed,
+            )
+            stages.append(stage)
+            total = stage["total"]
+            print(
+                f"concurrency {concurrency}: {total['rps']} req/s, "
+                f"p95 {total['p95_ms']} ms, {total['errors']} errors",
+                file=sys.stderr,
+            )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    result = {
+        "meta": {
+            "started_at": datetime.datetime.now(datetime.UTC).isoformat(),
+            "revision": git_revision(),
+            "base_url": base_url,
+            "mix": weights,
+            "duration_s": args.duration,
+            "workers": args.workers if args.boot else None,
+            "gemini_latency_ms": args.gemini_latency_ms if args.boot else None,
+            "products": args.products,
+            "upload_images": args.upload_images,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(stages, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boot", action="store_true", help="start the app and the fake Gemini server")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8788", help="app to target without --boot")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--gemini-port", type=int, default=8787)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=200)
+    parser.add_argument(
+        "--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32, 64]
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight pairs")
+    parser.add_argument("--products", type=int, default=5000, help="product ids 1..N to add to carts")
+    parser.add_argument("--upload-images", type=int, default=20, help="distinct images cycled by upload_repeat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--baseline", help="earlier JSON results to compare p95 against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""Seed a throwaway Postgres database for the benchmarks.
+
+Applies every migration to the database named by the usual RDB_* variables
+and fills `products` and `categories` with synthetic, reproducible rows.
+
+    python -m benchmarks.seed --products 5000 --reset
+"""
+
+import argparse
+import datetime
+import random
+from pathlib import Path
+
+import psycopg2
+from loguru import logger
+from psycopg2.extras import execute_values
+
+from benchmarks.fixtures import CATEGORIES, UNITS, product_names
+from migrations.migrate import RDB_URL
+
+MIGRATIONS_DIR = Path(__file__).parent.parent / "migrations"
+
+
+def apply_migrations(cur):
+    for file in sorted(MIGRATIONS_DIR.glob("0*.sql")):
+        cur.execute(file.read_text())
+        logger.debug(f"Applied {file.name}")
+
+
+def seed(product_count: int, reset: bool = False, seed_value: int = 0):
+    rng = random.Random(seed_value)
+    with psycopg2.connect(RDB_URL) as conn:
+        with conn.cursor() as cur:
+            if reset:
+                cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+            else:
+                cur.execute("SELECT to_regclass('public.products') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    cur.execute("SELECT count(*) FROM products")
+                    if cur.fetchone()[0]:
+                        raise SystemExit(
+                            "products already has rows; pass --reset to wipe the database"
+                        )
+            apply_migrations(cur)
+
+            execute_values(
+                cur,
+                "INSERT INTO categories (name) VALUES %s",
+                [(name,) for name in CATEGORIES],
+            )
+            cur.execute("SELECT id FROM categories")
+            category_ids = [row[0] for row in cur.fetchall()]
+
+            now = datetime.datetime.now(datetime.UTC)
+            rows = []
+            for i, name in enumerate(product_names(product_count, seed_value)):
+                brand = name.split()[0]
+                rows.append(
+                    (
+                        f"{8990000000000 + i}",
+                        name,
+                        brand,
+                        rng.randrange(10, 500) * 100,
+                        rng.choice(UNITS),
+                        rng.randrange(0, 200),
+                        rng.choice(category_ids + [None]),
+                        " ".join(name.split()[1:]),
+                        now,
+                        now,
+                    )
+                )
+            execute_values(
+                cur,
+                """
+                INSERT INTO products (barcode, name, brand, price, unit, stock,
+                                      category_id, keyword, created_at, updated_at)
+                VALUES %s
+                """,
+                rows,
+                page_size=1000,
+            )
+            cur.execute("ANALYZE products")
+        conn.commit()
+    logger.info(f"Seeded {product_count} products into {RDB_URL.rsplit('/', 1)[-1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--reset", action="store_true", help="drop and recreate the public schema first"
+    )
+    args = parser.parse_args()
+    seed(args.products, reset=args.reset, seed_value=args.seed)
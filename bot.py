@@ -1,8 +1,9 @@
+import asyncio
 import os
 import sys
 
+import asyncpg
 import polars as pl
-import psycopg2
 from dotenv import load_dotenv
 from loguru import logger
 from telegram import Update
@@ -14,10 +15,11 @@ from telegram.ext import (
     filters,
 )
 
+from services.log_config import configure_logging
+
 load_dotenv()
 
-logger.remove()
-logger.add(sys.stdout, level="DEBUG")
+configure_logging(sys.stdout)
 
 MASTERDB_USER = os.getenv("MASTERDB_USER")
 MASTERDB_PASSWORD = os.getenv("MASTERDB_PASSWORD")
@@ -38,120 +40,143 @@ MASTER_DATABASE_URL = f"postgresql://{MASTERDB_USER}:{MASTERDB_PASSWORD}@{MASTER
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
 
-def get_products(keyword: str) -> list[dict]:
-    q = f"SELECT id, name, price FROM products WHERE name ILIKE '%{keyword}%' OR keyword ILIKE '%{keyword}%'"
-    df = pl.read_database_uri(query=q, uri=RDB_URL)
-    logger.debug(f"Query executed: {q}")
-    return df.to_dicts()
+# Shared pool for the local database, opened in post_init
+BOT_DB_POOL_MIN_SIZE = int(os.getenv("BOT_DB_POOL_MIN_SIZE", "1"))
+BOT_DB_POOL_MAX_SIZE = int(os.getenv("BOT_DB_POOL_MAX_SIZE", "5"))
+# Updates handled at once. Every write is a single statement, so Postgres'
+# row locks order concurrent commands on the same product
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "8"))
+
+GET_PRODUCTS_QUERY = """
+    SELECT id, name, price FROM products
+    WHERE name ILIKE $1 OR keyword ILIKE $1
+"""
+
+_pool: asyncpg.Pool | None = None
+
+
+async def open_pool(application: Application):
+    global _pool
+    _pool = await asyncpg.create_pool(
+        RDB_URL, min_size=BOT_DB_POOL_MIN_SIZE, max_size=BOT_DB_POOL_MAX_SIZE
+    )
+
+
+async def close_pool(application: Application):
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("Database pool is not open")
+    return _pool
+
 
+async def get_products(keyword: str) -> list[dict]:
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = [dict(row) for row in await get_pool().fetch(GET_PRODUCTS_QUERY, f"%{escaped}%")]
+    logger.debug("Products found for {!r}: {}", keyword, len(rows))
+    return rows
 
-def insert_product(product):
+
+async def insert_product(product):
     try:
-        with psycopg2.connect(RDB_URL) as conn:
-            with conn.cursor() as cur:
-                # "INSERT/Product Name/3000/4000"
-                q = """
-                INSERT INTO products (name, purchase_price, price)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (name) DO UPDATE
-                SET purchase_price = EXCLUDED.purchase_price, price = EXCLUDED.price
-                """
-                cur.execute(
-                    q,
-                    (
-                        product["name"],
-                        product["purchase_price"],
-                        product["selling_price"],
-                    ),
-                )
-                conn.commit()
-                logger.debug(f"Product inserted: {product}")
-                formatted_product_details = f"Name: {product['name']}\nHarga Beli: {product['purchase_price']}\nHarga Jual: {product['selling_price']}"
-                return f"✅ Product '{product['name']}' inserted successfully.\n{formatted_product_details}"
-    except psycopg2.Error as e:
+        # "INSERT/Product Name/3000/4000"
+        q = """
+        INSERT INTO products (name, purchase_price, price)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (name) DO UPDATE
+        SET purchase_price = EXCLUDED.purchase_price, price = EXCLUDED.price
+        """
+        await get_pool().execute(
+            q,
+            product["name"],
+            product["purchase_price"],
+            product["selling_price"],
+        )
+        logger.debug("Product inserted: {}", product)
+        formatted_product_details = f"Name: {product['name']}\nHarga Beli: {product['purchase_price']}\nHarga Jual: {product['selling_price']}"
+        return f"✅ Product '{product['name']}' inserted successfully.\n{formatted_product_details}"
+    except asyncpg.PostgresError as e:
         logger.error(f"Error inserting product: {e}")
         return f"❌ Error inserting product: {e}"
-    return f"✅ Product '{product['name']}' inserted successfully. {product}"
 
 
-def update_product(product_id, new_selling_price):
+async def update_product(product_id, new_selling_price):
     try:
-        with psycopg2.connect(RDB_URL) as conn:
-            with conn.cursor() as cur:
-                q = """
-                UPDATE products
-                SET price = %s
-                WHERE id = %s
-                RETURNING id, name, price
-                """
-                cur.execute(q, (new_selling_price, product_id))
-                conn.commit()
-                logger.debug(f"Product updated: {product_id}, {new_selling_price}")
-                if cur.rowcount == 0:
-                    return f"❌ Product ID {product_id} not found."
-                updated_product = cur.fetchone()
-                formatted_product_details = f"Product ID: {updated_product[0]}\nName: {updated_product[1]}\nHarga Jual: {updated_product[2]}"
-                return f"✅ Product ID {product_id} updated successfully.\n{formatted_product_details}"
-    except psycopg2.Error as e:
+        q = """
+        UPDATE products
+        SET price = $1
+        WHERE id = $2
+        RETURNING id, name, price
+        """
+        updated_product = await get_pool().fetchrow(q, new_selling_price, product_id)
+        logger.debug("Product updated: {}, {}", product_id, new_selling_price)
+        if updated_product is None:
+            return f"❌ Product ID {product_id} not found."
+        formatted_product_details = f"Product ID: {updated_product[0]}\nName: {updated_product[1]}\nHarga Jual: {updated_product[2]}"
+        return f"✅ Product ID {product_id} updated successfully.\n{formatted_product_details}"
+    except asyncpg.PostgresError as e:
         logger.error(f"Error updating product: {e}")
         return f"❌ Error updating product: {e}"
 
 
-def delete_product(product_id):
+async def delete_product(product_id):
     try:
-        with psycopg2.connect(RDB_URL) as conn:
-            with conn.cursor() as cur:
-                q = """
-                DELETE FROM products
-                WHERE id = %s
-                RETURNING id, name, price
-                """
-                cur.execute(q, (product_id,))
-                conn.commit()
-                logger.debug(f"Product deleted: {product_id}")
-                if cur.rowcount == 0:
-                    return f"❌ Product ID {product_id} not found."
-                deleted_product = cur.fetchone()
-                formatted_product_details = f"Product ID: {deleted_product[0]}\nName: {deleted_product[1]}\nHarga Jual: {deleted_product[2]}"
-                return f"✅ Product ID {product_id} deleted successfully.\n{formatted_product_details}"
-    except psycopg2.Error as e:
+        q = """
+        DELETE FROM products
+        WHERE id = $1
+        RETURNING id, name, price
+        """
+        deleted_product = await get_pool().fetchrow(q, product_id)
+        logger.debug("Product deleted: {}", product_id)
+        if deleted_product is None:
+            return f"❌ Product ID {product_id} not found."
+        formatted_product_details = f"Product ID: {deleted_product[0]}\nName: {deleted_product[1]}\nHarga Jual: {deleted_product[2]}"
+        return f"✅ Product ID {product_id} deleted successfully.\n{formatted_product_details}"
+    except asyncpg.PostgresError as e:
         logger.error(f"Error deleting product: {e}")
         return f"❌ Error deleting product: {e}"
 
 
-def sync_supabase():
-    logger.debug(MASTER_DATABASE_URL)
-    logger.debug(RDB_URL)
-
-    df_supabase = pl.read_database_uri(
-        query="SELECT name, price FROM products_new", uri=MASTER_DATABASE_URL
-    ).cast({"price": pl.Int32})
-    df_local = pl.read_database_uri(
-        query="SELECT name, price FROM products", uri=RDB_URL
-    )
+async def sync_supabase():
+    local_rows = await get_pool().fetch("SELECT name, price FROM products")
+    # SYNC is rare; one connection for the run is enough for the legacy database
+    master = await asyncpg.connect(MASTER_DATABASE_URL)
+    try:
+        master_rows = await master.fetch("SELECT name, price FROM products_new")
+        df_supabase = pl.DataFrame(
+            [dict(row) for row in master_rows],
+            schema={"name": pl.String, "price": pl.Int32},
+        )
+        df_local = pl.DataFrame(
+            [dict(row) for row in local_rows],
+            schema={"name": pl.String, "price": pl.Int32},
+        )
 
-    df_diff = df_local.join(
-        df_supabase,
-        on=["name", "price"],
-        how="anti",  # Get rows in local that are not in supabase
-    )
+        df_diff = df_local.join(
+            df_supabase,
+            on=["name", "price"],
+            how="anti",  # Get rows in local that are not in supabase
+        )
 
-    logger.debug(df_diff)
-    if not df_diff.is_empty():
-        with psycopg2.connect(MASTER_DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                # on conflict update price
-                for row in df_diff.iter_rows(named=True):
-                    q = """
-                    INSERT INTO products_new (name, price)
-                    VALUES (%s, %s)
-                    ON CONFLICT (name) DO UPDATE
-                    SET price = EXCLUDED.price
-                    """
-                    cur.execute(q, (row["name"], row["price"]))
-                conn.commit()
+        logger.debug("Rows to sync: {}", df_diff)
+        if not df_diff.is_empty():
+            # on conflict update price
+            q = """
+            INSERT INTO products_new (name, price)
+            VALUES ($1, $2)
+            ON CONFLICT (name) DO UPDATE
+            SET price = EXCLUDED.price
+            """
+            async with master.transaction():
+                await master.executemany(q, df_diff.iter_rows())
+    finally:
+        await master.close()
     logger.debug("Database synced with the legacy supabase database.")
-    logger.debug("Sync completed.")
     formatted_diff = "\n".join(
         [f"{row['name']}: {row['price']}" for row in df_diff.iter_rows(named=True)]
     )
@@ -159,7 +184,7 @@ def sync_supabase():
     return f"✅ Database synced with the legacy supabase database.\n{formatted_diff}\nPlease update the local database at ikmimart.onrender.com"
 
 
-def parse_message(text):
+async def parse_message(text):
     # NOTE
     # FORMAT: "command/product_id/product_name/purchase_price/selling_price"
     # Command: INSERT, UPDATE, DELETE
@@ -194,8 +219,8 @@ def parse_message(text):
         keywords = parts[1].split(",") if len(parts) > 1 else []
 
         products = []
-        for keyword in keywords:
-            p = get_products(keyword)
+        found = await asyncio.gather(*(get_products(keyword) for keyword in keywords))
+        for keyword, p in zip(keywords, found):
             if p:
                 products.extend(p)
                 logger.debug(f"Products found for keyword '{keyword}': {p}")
@@ -241,7 +266,7 @@ def parse_message(text):
             "purchase_price": int(purchase_price),
             "selling_price": int(selling_price),
         }
-        msg = insert_product(product)
+        msg = await insert_product(product)
         return None, msg
     elif command == "UPDATE":
         # "- UPDATE/product_id/selling_price: Update an existing product's selling price.\n"
@@ -259,7 +284,7 @@ def parse_message(text):
         if not selling_price.isdigit():
             logger.debug(f"Invalid selling_price: {selling_price}")
             return None, f"❌ Invalid selling_price: {selling_price}, must be a number."
-        msg = update_product(int(product_id), int(selling_price))
+        msg = await update_product(int(product_id), int(selling_price))
         return None, msg
 
     elif command == "DELETE":
@@ -274,12 +299,12 @@ def parse_message(text):
         if not product_id.isdigit():
             logger.debug(f"Invalid product_id: {product_id}")
             return None, f"❌ Invalid product_id: {product_id}, must be a number."
-        msg = delete_product(int(product_id))
+        msg = await delete_product(int(product_id))
         return None, msg
     
     elif command == "SYNC":
         logger.debug("Sync command received.")
-        msg = sync_supabase()
+        msg = await sync_supabase()
         return None, msg
 
     else:
@@ -299,7 +324,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     logger.info(f"Message text: {text}")
 
-    product, error = parse_message(text)
+    product, error = await parse_message(text)
     if error:
         logger.error(error)
         await update.message.reply_text(error)
@@ -309,7 +334,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def main():
     # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .post_init(open_pool)
+        .post_shutdown(close_pool)
+        .build()
+    )
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -1,6 +1,7 @@
 import sqlite3
 import polars as pl
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
@@ -30,17 +31,49 @@ RDB_HOST_DOCKER = os.getenv("RDB_HOST_DOCKER")
 RDB_PORT = os.getenv("RDB_PORT")
 RDB_DATABASE = os.getenv("RDB_DATABASE")
 
+# Per-worker pool sizing; keep workers * (size + overflow) below max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Prepared statements kept per asyncpg connection; every hot query is a
+# constant SQL string with bound parameters, so each is planned once per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
 
 
 MASTER_DATABASE_URL = f"postgresql://{MASTERDB_USER}:{MASTERDB_PASSWORD}@{MASTERDB_HOST}:{MASTERDB_PORT}/{MASTERDB_NAME}"
 LOCAL_DATABASE_URL = f"postgresql://{RDB_USER}:{RDB_PASSWORD}@{RDB_HOST}:{RDB_PORT}/{RDB_DATABASE}"
+LOCAL_ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{RDB_USER}:{RDB_PASSWORD}@{RDB_HOST}:{RDB_PORT}/{RDB_DATABASE}"
+    f"?prepared_statement_cache_size={DB_STATEMENT_CACHE_SIZE}"
+)
 
 engine_master_db = create_engine(MASTER_DATABASE_URL)
 SessionLocal_master_db = sessionmaker(autocommit=False, autoflush=False, bind=engine_master_db)
 
-engine_local_db = create_engine(LOCAL_DATABASE_URL)
+engine_local_db = create_engine(
+    LOCAL_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
 SessionLocal_local_db = sessionmaker(autocommit=False, autoflush=False, bind=engine_local_db)
 
+async_engine_local_db = create_async_engine(
+    LOCAL_ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal_local_db = async_sessionmaker(
+    bind=async_engine_local_db, autoflush=False, expire_on_commit=False
+)
+
 def get_local_master():
     db = SessionLocal_master_db()
     try:
@@ -59,6 +92,14 @@ def get_local_db():
         db.close()
 
 
+async def get_local_async_db():
+    """
+    Async counterpart of `get_local_db` for `async def` endpoints.
+    """
+    async with AsyncSessionLocal_local_db() as db:
+        yield db
+
+
 def download_master_table(db_uri=MASTER_DATABASE_URL) -> pl.DataFrame:
     print(f"Get data from table: {PRODUCTS_TABLE}")
     q = f"SELECT barcode, name, price, unit, search_term, tags FROM {PRODUCTS_TABLE}"
@@ -0,0 +1,33 @@
+import os
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL")
+# Sessions and carts must not share an instance whose eviction policy can drop
+# them under cache pressure; falls back to REDIS_URL for single-instance setups
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL") or REDIS_URL
+
+_redis: dict[str, redis.Redis] = {}
+
+
+def get_redis(url: str | None = REDIS_URL) -> redis.Redis | None:
+    """Shared Redis connection pool for `url`, or None when it is not configured."""
+    if not url:
+        return None
+    if url not in _redis:
+        _redis[url] = redis.from_url(
+            url,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+            health_check_interval=30,
+        )
+    return _redis[url]
+
+
+async def close_redis():
+    while _redis:
+        _, client = _redis.popitem()
+        await client.aclose()
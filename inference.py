@@ -1,46 +1,97 @@
+import asyncio
 import base64
 import io
 import json
 import os
-import sys
+import random
 
+import httpx
 import polars as pl
-import requests
 from dotenv import load_dotenv
 from loguru import logger
 from PIL import Image
 
-load_dotenv()
+from services.log_config import configure_logging
+from services.metrics import stage_timer
 
-logger.remove()
-logger.add(sys.stderr, level="DEBUG")
+load_dotenv()
 
 API_KEY = os.getenv("GEMINI_API_KEY")
 if not API_KEY:
     raise ValueError("API_KEY is not set in the environment variables.")
 
+GEMINI_URL = os.getenv(
+    "GEMINI_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent",
+)
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# JPEG or WEBP; both are far smaller than PNG for camera photos
+MODEL_IMAGE_FORMAT = os.getenv("MODEL_IMAGE_FORMAT", "JPEG").upper()
+MODEL_IMAGE_QUALITY = int(os.getenv("MODEL_IMAGE_QUALITY", "85"))
+
+_client: httpx.AsyncClient | None = None
+_concurrency = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client, created on first use inside the event loop."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json", "x-goog-api-key": API_KEY},
+            timeout=httpx.Timeout(
+                GEMINI_READ_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=GEMINI_MAX_CONCURRENCY,
+                max_keepalive_connections=GEMINI_MAX_CONCURRENCY,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
-def encode_resized_image_to_base64(image_path, max_size=(512, 512)) -> str:
-    with Image.open(image_path) as img:
+def _backoff(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def encode_resized_image_to_base64(image_bytes: bytes, max_size=(512, 512)) -> tuple[str, str]:
+    """Downscale and re-encode for the model, returning (base64 data, mime type)."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # JPEG only: let the decoder downscale by 1/2..1/8 instead of decoding full size
+        img.draft("RGB", max_size)
         img.thumbnail(max_size)  # Resize in-place, preserving aspect ratio
+        if img.mode != "RGB":
+            img = img.convert("RGB")
         buffered = io.BytesIO()
-        img.save(buffered, format="PNG")  # or "JPEG"
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
-
+        img.save(buffered, format=MODEL_IMAGE_FORMAT, quality=MODEL_IMAGE_QUALITY)
+        data = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        return data, Image.MIME[MODEL_IMAGE_FORMAT]
 
-def infer_model(prompt: str, image_path: str = None) -> str:
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={API_KEY}"
-    headers = {"Content-Type": "application/json"}
 
+async def infer_model(prompt: str, image_bytes: bytes | None = None) -> dict | None:
     parts = [{"text": prompt}]
 
-    if image_path:
-        logger.debug(image_path)
-        base64_image = encode_resized_image_to_base64(image_path)
+    if image_bytes:
+        logger.debug("Image size: {} bytes", len(image_bytes))
+        base64_image, mime_type = await asyncio.to_thread(
+            encode_resized_image_to_base64, image_bytes
+        )
         parts.append(
             {
                 "inlineData": {
-                    "mimeType": "image/png",  # match format from `save(...)`
+                    "mimeType": mime_type,
                     "data": base64_image,
                 }
             }
@@ -53,16 +104,34 @@ def infer_model(prompt: str, image_path: str = None) -> str:
         },
     }
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        logger.debug(response.json())
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
-        return None
-
-
-def get_prediction_result(image_path) -> pl.DataFrame | None:
+    last_error = None
+    async with _concurrency:
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                with stage_timer("gemini"):
+                    response = await get_client().post(GEMINI_URL, json=data)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    payload = response.json()
+                    logger.debug("Gemini response: {}", payload)
+                    return payload
+                last_error = f"status {response.status_code}"
+                logger.warning(f"Gemini returned {response.status_code}, attempt {attempt + 1}")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = repr(e)
+                logger.warning(f"Gemini request failed: {e!r}, attempt {attempt + 1}")
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Gemini request failed: {e!r}")
+                return None
+            if attempt < GEMINI_MAX_RETRIES:
+                await asyncio.sleep(_backoff(attempt))
+    logger.error(
+        f"Gemini request failed after {GEMINI_MAX_RETRIES + 1} attempts: {last_error}"
+    )
+    return None
+
+
+async def get_prediction_result(image_bytes: bytes) -> pl.DataFrame | None:
     nl = """
         INSTRUCTION:
         - Extract all product names from the image.
@@ -95,16 +164,15 @@ def get_prediction_result(image_path) -> pl.DataFrame | None:
     """
 
     try:
-        logger.debug(image_path)
-        response = infer_model(prompt=nl, image_path=image_path)
-        logger.debug(f"Response: {response}")
+        response = await infer_model(prompt=nl, image_bytes=image_bytes)
+        logger.debug("Response: {}", response)
         response_content = (
             response.get("candidates")[0].get("content").get("parts")[0].get("text")
         )
         response_content = _post_process_response(response_content)
         return response_content
     except Exception as e:
-        print(f"Error processing image {image_path}: {e}")
+        logger.error(f"Error processing image: {e!r}")
         return None
 
 
@@ -122,11 +190,21 @@ def _post_process_response(response: str) -> pl.DataFrame:
         return df
 
     except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {e}")
+        logger.error(f"Error decoding JSON: {e!r}")
         return pl.DataFrame()
 
 
+async def _main(image_paths: list[str]):
+    for image_path in image_paths:
+        print(f"Processing image: {image_path}")
+        with open(image_path, "rb") as f:
+            result = await get_prediction_result(f.read())
+        print(result)
+    await close_client()
+
+
 if __name__ == "__main__":
+    configure_logging()
     # image_path = "/home/hattajr/lab/ikmimart/.trash/test_images/belinis2.jpg"
     image_paths = [
         ".trash/images/2000000203119.png",
@@ -135,7 +213,4 @@ if __name__ == "__main__":
         ".trash/images/6191315500034.png",
     ]
 
-    for image_path in image_paths:
-        print(f"Processing image: {image_path}")
-        result = get_prediction_result(image_path)
-        print(result)
+    asyncio.run(_main(image_paths))
@@ -1,52 +1,267 @@
-import datetime
+import asyncio
+import hashlib
 import os
-import shutil
-import sys
 import uuid
-from collections import deque, defaultdict, Counter
-from tempfile import NamedTemporaryFile
-from typing import Any
-from rapidfuzz import process, fuzz, utils
+from urllib.parse import urlencode
+from contextlib import asynccontextmanager
 
 import polars as pl
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, Query, Request, Response, UploadFile
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from jinja2_fragments.fastapi import Jinja2Blocks
 from loguru import logger
-from sqlalchemy.orm import Session
-
-from db.database import get_local_db
-from inference import get_prediction_result
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from db.database import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    async_engine_local_db,
+    engine_local_db,
+    get_local_async_db,
+)
+from db.redis_client import close_redis
+from inference import close_client, get_prediction_result
 from schema.schema import SearchLog
-from services.db_services import log_search_query
+from services.catalog import (
+    CATALOG_REFRESH_SECONDS,
+    get_catalog,
+    image_sources,
+    refresh_catalog,
+)
+from services.db_services import (
+    search_products,
+    search_products_batch,
+)
+from services.fragment_cache import fragment_cache
+from services.image_cache import get_cached_prediction
+from services.image_derivatives import DERIVED_IMAGE_URL, get_derivative
+from services.log_config import configure_logging, sampled_logger
+from services.metrics import (
+    FRAGMENT_CACHE_BYTES,
+    SEARCH_LOG_QUEUE,
+    SEARCH_LOGS_DROPPED,
+    SESSION_BYTES,
+    SESSIONS,
+    RequestTimingMiddleware,
+    metrics_response,
+    stage_timer,
+    watch_pool,
+)
+from services.request_profiler import (
+    RequestProfilerMiddleware,
+    list_profiles,
+    profile_path,
+    token_matches,
+)
+from services.search_log_writer import search_log_writer
+from services.sessions import (
+    SESSION_EXPIRY_MINUTES,
+    SESSION_SWEEP_SECONDS,
+    SessionExpired,
+    get_now,
+    session_store,
+)
+from services.static_assets import (
+    DIST_DIR,
+    PrecompressedStaticFiles,
+    asset_url,
+    build_fingerprint,
+)
+from services.top_queries import (
+    get_top_queries,
+    refresh_top_queries,
+    top_queries_refresher,
+)
 
 load_dotenv()
 
-logger.remove()
-logger.add(sys.stderr, level=os.getenv("LOG_LEVEL", "DEBUG").upper())
+configure_logging()
 logger.info(f"Web server run at port {os.getenv('APP_PORT')}")
 
 
-app = FastAPI()
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+async def catalog_refresher():
+    """Poll the catalog version and swap in a fresh snapshot when it changes."""
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(refresh_catalog)
+        except Exception as e:
+            logger.error(f"Error refreshing catalog snapshot: {e}")
+
+
+async def session_sweeper():
+    """Evict idle sessions and report how many are held in this worker."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            expired = await session_store.sweep()
+            stats = session_store.stats()
+            if stats:
+                SESSIONS.set(stats["sessions"])
+                SESSION_BYTES.set(stats["bytes"])
+                logger.info(
+                    f"Sessions: {stats['sessions']} live, ~{stats['bytes']} bytes, "
+                    f"{expired} expired"
+                )
+        except Exception as e:
+            logger.error(f"Error sweeping sessions: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(refresh_catalog, True)
+    await asyncio.to_thread(build_fingerprint)
+    refresher = asyncio.create_task(catalog_refresher())
+    sweeper = asyncio.create_task(session_sweeper())
+    try:
+        await refresh_top_queries()
+    except Exception as e:
+        logger.error(f"Error loading top queries: {e}")
+    top_queries_task = asyncio.create_task(top_queries_refresher())
+    search_log_writer.start()
+    yield
+    await search_log_writer.close()
+    refresher.cancel()
+    sweeper.cancel()
+    top_queries_task.cancel()
+    await close_client()
+    await close_redis()
+
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads from Content-Length before the body is parsed."""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            headers = dict(scope["headers"])
+            content_length = headers.get(b"content-length")
+            if content_length and int(content_length) > self.max_bytes:
+                response = Response("Upload too large", status_code=413)
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class InMemoryMultiPartParser(MultiPartParser):
+    """Keeps file parts in memory; the default spools anything over 1 MB to disk."""
 
-PRODUCT_IMAGE_URL = "/static/images"
-IMAGE_FORMAT = "png"
+    spool_max_size = MAX_UPLOAD_BYTES
+
+
+async def read_upload(request: Request, field: str = "file") -> bytes:
+    """Bytes of the uploaded file `field`, parsed without any disk I/O.
+
+    The body is capped at MAX_UPLOAD_BYTES while it streams in, which also
+    covers chunked uploads that carry no Content-Length, so no file part can
+    outgrow the in-memory spool.
+    """
+
+    async def capped_stream():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Upload too large")
+            yield chunk
+
+    parser = InMemoryMultiPartParser(request.headers, capped_stream(), max_files=1)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    try:
+        upload = form.get(field)
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=422, detail=f"Missing file field {field!r}")
+        return await upload.read()
+    finally:
+        await form.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+app.add_middleware(RequestProfilerMiddleware)
+app.add_middleware(RequestTimingMiddleware)
+
+watch_pool("sync", engine_local_db.pool, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+watch_pool("async", async_engine_local_db.pool, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+FRAGMENT_CACHE_BYTES.set_function(lambda: fragment_cache.size)
+SEARCH_LOG_QUEUE.set_function(search_log_writer.queue.qsize)
+SEARCH_LOGS_DROPPED.set_function(lambda: search_log_writer.dropped)
+
+SEARCH_COLUMNS = ["id", "barcode", "name", "price", "unit", "image_url"]
+CART_ITEM_COLUMNS = ["id", "name", "price", "unit", "image_url"]
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "24"))
 SESSION_COOKIE_NAME = "ikmimart_session_id"
-SESSION_EXPIRY_MINUTES = 30
+# "memory" searches the in-process catalog snapshot, "postgres" the trigram index
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()
 
+app.mount("/static/dist", PrecompressedStaticFiles(directory=DIST_DIR, check_dir=False), name="dist")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-templates = Jinja2Blocks(directory="templates")
 
-session_data = {}
 
+class TimedJinja2Blocks(Jinja2Blocks):
+    def TemplateResponse(self, *args, **kwargs):
+        with stage_timer("render"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+templates = TimedJinja2Blocks(directory="templates")
+templates.env.globals["image_sources"] = image_sources
+templates.env.globals["asset_url"] = asset_url
+
+
+def catalog_etag(request: Request) -> str:
+    """Strong ETag for a response that only depends on the URL and the catalog.
+
+    The catalog version is bumped on every products and categories write and
+    the build fingerprint changes with templates and assets, so the tag
+    changes exactly when the rendered page can. Gzip and HTMX variants get
+    their own tags since they are different representations.
+    """
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    key = "|".join(
+        [
+            str(get_catalog().version),
+            build_fingerprint(),
+            request.url.path,
+            request.url.query,
+            str(bool(request.headers.get("HX-Request"))),
+            str(gzip),
+        ]
+    )
+    return '"' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '"'
 
-def get_now() -> datetime.datetime:
-    return datetime.datetime.now(datetime.UTC)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def set_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    # Accept-Encoding is added by GZipMiddleware or the fragment cache when
+    # they compress
+    vary = response.headers.get("Vary")
+    response.headers["Vary"] = f"{vary}, HX-Request" if vary else "HX-Request"
+    return response
 
 
 def generate_session_id() -> str:
@@ -58,7 +273,7 @@ def get_session_id(request: Request) -> str | None:
     return request.cookies.get(SESSION_COOKIE_NAME)
 
 
-def create_session_id(response: Response) -> tuple[str, Response]:
+async def create_session_id(response: Response) -> tuple[str, Response]:
     session_id = generate_session_id()
 
     response.set_cookie(
@@ -70,24 +285,19 @@ def create_session_id(response: Response) -> tuple[str, Response]:
         samesite="lax",
     )
 
-    # Initialize empty session data in Redis
-    session_data[session_id] = {
-        "created_at": get_now(),
-        "cart": {},
-        "search_history": deque(maxlen=5),
-    }
+    # Initialize empty session data in the session store
+    await session_store.create(session_id)
     return session_id, response
 
 
-def get_or_create_session(request: Request, response: Response) -> tuple[str, Response]:
+async def get_or_create_session(request: Request, response: Response) -> tuple[str, Response]:
     """Get existing session or create new one"""
     session_id = get_session_id(request)
 
-    logger.debug(session_id)
-    logger.debug(session_data.keys())
-    if session_id and session_id in session_data:
+    if session_id and await session_store.exists(session_id):
         # Session exists, extend expiry
-        logger.info("Session exists")
+        sampled_logger.info("Session {} exists", session_id)
+        await session_store.touch(session_id)
         response.set_cookie(
             key=SESSION_COOKIE_NAME,
             value=session_id,
@@ -97,28 +307,37 @@ def get_or_create_session(request: Request, response: Response) -> tuple[str, Re
             samesite="lax",
         )
         return session_id, response
-    logger.info("Create NEW SESSION")
-    return create_session_id(response)
+    sampled_logger.info("Create NEW SESSION")
+    return await create_session_id(response)
 
 
-def get_session_data(session_id: str) -> dict[str, Any]:
-    """Get session data from Redis"""
-    data = session_data.get(session_id)
-    if data:
-        return data
-    return {}
+async def require_session(request: Request) -> str:
+    """The request's live session ID; raises SessionExpired if there is none."""
+    session_id = get_session_id(request)
+    if not session_id or not await session_store.exists(session_id):
+        raise SessionExpired(session_id)
+    return session_id
+
+
+@app.exception_handler(SessionExpired)
+async def session_expired_handler(request: Request, exc: SessionExpired):
+    """Send cart actions without a live session back to the home page."""
+    response = Response(status_code=401)
+    response.headers["HX-Redirect"] = "/"
+    response.delete_cookie(SESSION_COOKIE_NAME)
+    return response
 
 
 async def get_session(request: Request, response: Response) -> str:
-    return get_or_create_session(request, response)
+    return await get_or_create_session(request, response)
 
 
-def get_cart(session_id: str, db: Session) -> pl.DataFrame:
-    session_data = get_session_data(session_id)
-    cart = session_data.get("cart")
+async def get_cart(session_id: str) -> pl.DataFrame:
+    """Full cart joined with the catalog; only the /cart page needs this."""
+    cart = await session_store.get_cart(session_id)
     if not cart:
         return pl.DataFrame()
-    logger.debug(cart)
+    sampled_logger.debug("Cart: {}", cart)
 
     cart_ = []
     for product_id, product in cart.items():
@@ -126,19 +345,20 @@ def get_cart(session_id: str, db: Session) -> pl.DataFrame:
             dict(
                 id=product_id,
                 qty=product["qty"],
+                price=product["price"],
                 updated_at=product["updated_at"],
             )
         )
 
     df_cart = pl.DataFrame(cart_)
-    df_product = search_product_by_id(list(cart.keys()), db=db)
-    logger.debug(df_product)
+    df_product = search_product_by_id(list(cart.keys()))
+    sampled_logger.debug("Cart products: {}", df_product)
     if df_product.is_empty():
         return pl.DataFrame()
 
     df_result = (
         df_cart.join(
-            df_product,
+            df_product.drop("price"),
             left_on="id",
             right_on="id",
         )
@@ -147,150 +367,84 @@ def get_cart(session_id: str, db: Session) -> pl.DataFrame:
     )
     return df_result
 
-def postprocess_query_result(df: pl.DataFrame) -> pl.DataFrame:
-    df = (
-        df.with_columns(
-            image_url=pl.when(
-                ~(pl.col("image_url").is_not_null())
-                & (pl.col("barcode").is_not_null())
-            )
-            .then(
-                pl.concat_str(
-                    [pl.lit(PRODUCT_IMAGE_URL), pl.col("barcode")], separator="/"
-                )
-            )
-            .otherwise(pl.col("image_url"))
-        )
-        .with_columns(
-            image_url=pl.when(
-                pl.col("image_url").str.starts_with(PRODUCT_IMAGE_URL)
-            )
-            .then(
-                pl.concat_str(
-                    [pl.col("image_url"), pl.lit(IMAGE_FORMAT)], separator="."
-                )
-            )
-            .otherwise(pl.col("image_url"))
-        )
-        .with_columns(name=pl.col("name").str.to_titlecase())
-    )
-    logger.debug(df)
-    return df
 
-def query_products(query: str, db: Session) -> pl.DataFrame:
-    df = pl.read_database(query=query, connection=db, infer_schema_length=500)
-    logger.debug(df)
-    if not df.is_empty():
-        df = postprocess_query_result(df)
-        return df
-    return pl.DataFrame()
-
-def fuzz_search_products(keyword: str, db: Session) -> pl.DataFrame:
-    df = pl.read_database(query="SELECT id, barcode, name, brand, keyword, price, unit, image_url FROM products", connection=db, infer_schema_length=500)
-    logger.debug(df)
-    df = df.with_columns(join_str=pl.concat_str(["name", "brand", "keyword"], separator=" ", ignore_nulls=True)).sort("id")
-    prodcuts_names = df['join_str'].to_list()
-    results = process.extract(keyword, prodcuts_names, scorer=fuzz.WRatio, limit=6, processor=utils.default_process, score_cutoff=60)
-    logger.debug(f"Fuzz search results for '{keyword}': {results}")
-    if results:
-        selected_rows = []
-        for result in results:
-            if result[1] >= 60:
-                _d = dict(
-                    product_str = result[0],
-                    score = result[1],
-                    index = result[2]
-                )
-                selected_rows.append(_d)
-        df_matched = pl.from_dicts(selected_rows)
-        logger.debug(df_matched)
-
-        df_result = df.join(
-            df_matched,
-            left_on="join_str",
-            right_on="product_str",
-        ).select(
-            "id", "barcode", "name", "price", "unit", "image_url", "score"
-        ).sort("score", descending=True)
-
-        df_result = postprocess_query_result(df_result)
-        logger.debug(df_result)
+def cart_item_snapshot(product: dict) -> dict:
+    """The product fields a cart item keeps, including the price at add time."""
+    return {column: product[column] for column in CART_ITEM_COLUMNS}
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+def fuzz_search_products(keyword: str) -> pl.DataFrame:
+    with stage_timer("fuzzy_search"):
+        df_result = get_catalog().fuzzy_search(keyword)
+    sampled_logger.debug("Fuzz search results for {!r}: {}", keyword, df_result)
+    if df_result.is_empty():
         return df_result
-    return pl.DataFrame()
-
-def search_product_by_keyword(keyword: str, db: Session) -> pl.DataFrame:
-    if keyword == "CATALOG":
-        q = "SELECT id, barcode, name, price, unit, image_url FROM products"
-        return query_products(q, db)
-    q = f"""
-        SELECT id, barcode, name, price, unit, image_url
-        FROM public.products
-        WHERE (COALESCE(name, '') || ' ' || COALESCE(brand, '') || ' ' || COALESCE(keyword, '')) ILIKE '%{keyword}%';
-    """
-    df = query_products(q, db)
+    return df_result.select(SEARCH_COLUMNS + ["score"])
+
+def search_catalog(keyword: str) -> pl.DataFrame:
+    with stage_timer("catalog_search"):
+        df = get_catalog().search(keyword).select(SEARCH_COLUMNS)
     if df.is_empty():
-        df = fuzz_search_products(keyword, db)
+        df = fuzz_search_products(keyword)
     return df
 
 
-def search_product_by_id(id: int | list[int], db: Session) -> pl.DataFrame:
-    if isinstance(id, list):
-        id = ",".join([str(i) for i in id])
-        query = f"SELECT * FROM products WHERE id IN ({id})"
-        logger.debug(query)
-    else:
-        id = str(id)
-        query = f"SELECT * FROM products WHERE id = {id}"
-        logger.debug(query)
-    return query_products(query, db)
-
-def get_top_queries(db, top_n=15):
-    q = """
-    SELECT query 
-    FROM search_logs 
-    WHERE searched_at > NOW() - INTERVAL '14 days'
-      AND items_found BETWEEN 1 AND 10
-    """
-    df = pl.read_database(query=q, connection=db)
+async def search_product_by_keyword(
+    keyword: str, db: AsyncSession | None = None
+) -> pl.DataFrame:
+    if SEARCH_BACKEND == "postgres" and db is not None:
+        with stage_timer("db_search"):
+            return await search_products(db, keyword)
+    return search_catalog(keyword)
 
-    if df.is_empty():
-        return []
-    
-    df = df.filter(
-        (pl.col("query").str.len_chars() >= 4) &
-        pl.col("query").str.contains("^[a-zA-Z0-9 ]+$")
-    )
-    
-    queries = [q.strip().lower() for q in df['query'].to_list()]
-    queries = [q.replace("  ", " ") for q in queries if q]  # Remove empty strings and extra spaces
-    counts = Counter(queries)
 
-    unvisited = set(counts.keys())
-    clusters = []
+async def resolve_keywords(
+    keyword_groups: list[list[str]], db: AsyncSession | None = None
+) -> list[tuple[str, pl.DataFrame]]:
+    """Resolve each group's keywords in priority order; the first keyword with hits wins.
 
-    while unvisited:
-        q = unvisited.pop()
-        matches = process.extract(q, unvisited, scorer=fuzz.token_sort_ratio, limit=20)
-        group = [q] + [m[0] for m in matches if m[1] > 85]
-        unvisited.difference_update(group[1:]) 
-        clusters.append(group)
+    The postgres backend searches every distinct keyword in one round trip,
+    the in-memory backend only searches keywords until a group is resolved.
+    """
+    if SEARCH_BACKEND == "postgres" and db is not None:
+        keywords = list(dict.fromkeys(k for group in keyword_groups for k in group))
+        with stage_timer("db_search"):
+            found = await search_products_batch(db, keywords)
+
+        def lookup(keyword):
+            return found.get(keyword)
+    else:
+        memo = {}
+
+        def lookup(keyword):
+            if keyword not in memo:
+                memo[keyword] = search_catalog(keyword)
+            return memo[keyword]
+
+    resolved = []
+    for group in keyword_groups:
+        for keyword in group:
+            df = lookup(keyword)
+            if df is not None and not df.is_empty():
+                resolved.append((keyword, df))
+                break
+    return resolved
 
-    results = []
-    for group in clusters:
-        canonical = max(group, key=lambda q: (len(q)))
-        total = sum(counts[q] for q in group)
-        results.append((canonical, total))
 
-    return sorted(results, key=lambda x: x[1], reverse=True)[:top_n]
+def search_product_by_id(id: int | list[int]) -> pl.DataFrame:
+    ids = id if isinstance(id, list) else [id]
+    return get_catalog().by_ids(ids)
 
 @app.get("/", response_class=HTMLResponse)
-def root(request: Request, response: Response, db: Session = Depends(get_local_db)):
-    top_queries = get_top_queries(db)
+async def root(request: Request, response: Response):
+    top_queries = get_top_queries()
     context = {"request": request, "top_queries": top_queries}
     if not request.headers.get("HX-Request"):
         response = templates.TemplateResponse(request=request, name="index.html", context=context)
         response.delete_cookie(SESSION_COOKIE_NAME)
-        logger.debug(session_data.keys())
         return response
     response = templates.TemplateResponse(
         request=request, name="index.html", context=context
@@ -300,25 +454,24 @@ def root(request: Request, response: Response, db: Session = Depends(get_local_d
 
 
 @app.get("/search", response_class=HTMLResponse)
-def search(
+async def search(
     request: Request,
     response: Response,
     q: str = Query(...),
-    db: Session = Depends(get_local_db),
+    db: AsyncSession = Depends(get_local_async_db),
 ):
     if not request.headers.get("HX-Request"):
         response = RedirectResponse(url="/")
         response.delete_cookie(SESSION_COOKIE_NAME)
-        logger.debug(session_data.keys())
         return response
-    session_id, response = get_or_create_session(request=request, response=response)
-    top_queries = get_top_queries(db)
+    session_id, response = await get_or_create_session(request=request, response=response)
+    top_queries = get_top_queries()
     url = request.headers.get("HX-Current-URL").split("/")[-1]
     if url == "cart":
-        logger.debug(session_data[session_id])
-        q = session_data[session_id]["search_history"][-1] if session_data[session_id]["search_history"] else ""
-        products_search = search_product_by_keyword(q, db)
-        products = get_cart(session_id, db=db)
+        search_history = await session_store.search_history(session_id)
+        q = search_history[-1] if search_history else ""
+        products_search = await search_product_by_keyword(q, db)
+        products = await get_cart(session_id)
         context = dict(
             products=products_search.to_dicts(),
             total_price=products["total_price"].sum(),
@@ -330,25 +483,47 @@ def search(
         )
 
     keyword = q
-    products = search_product_by_keyword(keyword, db)
-    session_data[session_id]["search_history"].append(keyword)
-    logger.debug(session_data[session_id]["search_history"])
-    logger.debug(f"{session_id}: {session_data[session_id]}")
-
-    log_search_query(
-        db=db,
-        search_log=SearchLog(
+    etag = catalog_etag(request)
+    if etag_matches(request, etag):
+        # Same query, same catalog: the client already has this fragment. The
+        # repeat is not logged again, so back/forward navigation does not skew
+        # the top queries.
+        await session_store.push_search(session_id, keyword)
+        response = set_etag(Response(status_code=304), etag)
+        response.set_cookie(
+            key=SESSION_COOKIE_NAME,
+            value=session_id,
+            max_age=SESSION_EXPIRY_MINUTES * 60,
+            httponly=True,
+            secure=False,
+            samesite="lax",
+        )
+        return response
+
+    # Results only depend on the normalized keyword, the catalog version and
+    # the build, so hits skip the search and the template render altogether
+    normalized = normalize_keyword(keyword)
+    cache_key = (get_catalog().version, build_fingerprint(), SEARCH_BACKEND, normalized)
+    fragment = fragment_cache.get(cache_key)
+    if fragment is None:
+        products = await search_product_by_keyword(normalized, db)
+        context = {"request": request, "products": products.to_dicts()}
+        rendered = templates.TemplateResponse(
+            "index.html", context=context, block_names=["result_list"]
+        )
+        fragment = fragment_cache.put(cache_key, rendered.body, items_found=len(products))
+    await session_store.push_search(session_id, keyword)
+
+    search_log_writer.log(
+        SearchLog(
             session_id=session_id,
             query=keyword,
-            searched_at=get_now().isoformat(),
-            items_found=len(products) if not products.is_empty() else 0,
-        ),
+            searched_at=get_now(),
+            items_found=fragment.items_found,
+        )
     )
 
-    context = {"request": request, "products": products.to_dicts()}
-    response = templates.TemplateResponse(
-        "index.html", context=context, block_names=["result_list"]
-    )
+    response = fragment.response(request)
     response.set_cookie(
         key=SESSION_COOKIE_NAME,
         value=session_id,
@@ -357,12 +532,12 @@ def search(
         secure=False,
         samesite="lax",
     )
-    return response
+    return set_etag(response, etag)
 
 
 @app.get("/show-camera", response_class=HTMLResponse)
 async def show_camera(request: Request, response: Response):
-    logger.debug("Show camera")
+    sampled_logger.debug("Show camera")
     if not request.headers.get("HX-Request"):
         response = templates.TemplateResponse(request=request, name="index.html")
         return response
@@ -373,22 +548,21 @@ async def show_camera(request: Request, response: Response):
 
 
 @app.get("/cart", response_class=HTMLResponse)
-async def view_cart(
-    request: Request, response: Response, db: Session = Depends(get_local_db)
-):
+async def view_cart(request: Request, response: Response):
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
-    if not session_id or session_id not in session_data:
+    if not session_id or not await session_store.exists(session_id):
         response = RedirectResponse(url="/")
         response.delete_cookie(SESSION_COOKIE_NAME)
         return response
 
-    df_cart = get_cart(session_id, db=db)
-    logger.debug(df_cart)
+    df_cart = await get_cart(session_id)
+    sampled_logger.debug("Cart: {}", df_cart)
+    search_history = await session_store.search_history(session_id)
     context = dict(
         cart=df_cart.to_dicts(),
         total_price=f"{df_cart['total_price'].sum():,.0f}",
         total_items=df_cart["qty"].sum(),
-        last_query=session_data[session_id]["search_history"][-1],
+        last_query=search_history[-1] if search_history else "",
     )
 
     if not request.headers.get("HX-Request"):
@@ -405,28 +579,23 @@ async def add_to_cart(
     request: Request,
     response: Response,
     product_id: int = Query(...),
-    db: Session = Depends(get_local_db),
 ):
-    session_id = request.cookies.get(SESSION_COOKIE_NAME)
-    if product_id not in session_data[session_id]["cart"]:
-        session_data[session_id]["cart"][product_id] = {
-            "qty": 0,
-            "updated_at": get_now(),
-        }
-    session_data[session_id]["cart"][product_id]["qty"] += 1
-    session_data[session_id]["cart"][product_id]["updated_at"] = get_now()
-
-    df_cart = get_cart(session_id, db=db)
-    logger.debug(df_cart)
+    session_id = await require_session(request)
+    product = get_catalog().product(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    item, totals = await session_store.add_to_cart(
+        session_id, cart_item_snapshot(product)
+    )
+    sampled_logger.debug("Cart totals: {}", totals)
 
     url = request.headers.get("HX-Current-URL").split("/")[-1]
-    logger.debug(url)
+    sampled_logger.debug("Current URL: {}", url)
     if url == "cart":
-        df_product = df_cart.filter(pl.col("id") == product_id)
         context = dict(
-            product=df_product.to_dicts()[0] if not df_product.is_empty() else None,
-            total_price=f"{df_cart['total_price'].sum():,.0f}",
-            total_items=df_cart["qty"].sum(),
+            product=item,
+            total_price=f"{totals['total_price']:,.0f}",
+            total_items=totals["total_items"],
         )
         return templates.TemplateResponse(
             request=request, name="cart/partials/item.html", context=context
@@ -434,9 +603,9 @@ async def add_to_cart(
 
     context = {
         "session_id": session_id,
-        "total_items": df_cart["qty"].sum(),
+        "total_items": totals["total_items"],
     }
-    logger.debug(context)
+    sampled_logger.debug("Context: {}", context)
     response = templates.TemplateResponse(
         request=request,
         name="index.html",
@@ -444,7 +613,6 @@ async def add_to_cart(
         block_name="cart_count_badge",
     )
     # _, response = get_or_create_session(request, response)
-    logger.debug(session_data[session_id])
     return response
 
 
@@ -454,18 +622,14 @@ async def cart_item_change_count(
     response: Response,
     product_id: int,
     action: str = Query(...),
-    db: Session = Depends(get_local_db),
 ):
-    session_id = request.cookies.get(SESSION_COOKIE_NAME)
+    session_id = await require_session(request)
 
-    def _updated_data():
-        logger.info("Get data from cart")
-        df_cart = get_cart(session_id, db=db)
-        df_product = df_cart.filter(pl.col("id") == product_id)
+    def _updated_data(item: dict | None, totals: dict):
         context = {
-            "product": df_product.to_dicts()[0] if not df_product.is_empty() else None,
-            "total_price": f"{df_cart['total_price'].sum():,.0f}",
-            "total_items": df_cart["qty"].sum(),
+            "product": item,
+            "total_price": f"{totals['total_price']:,.0f}",
+            "total_items": totals["total_items"],
         }
         return templates.TemplateResponse(
             request=request,
@@ -473,21 +637,14 @@ async def cart_item_change_count(
             context=context,
         )
 
-    cart = session_data[session_id]["cart"]
     if action == "increase":
-        cart[product_id]["qty"] += 1
-        return _updated_data()
+        return _updated_data(*await session_store.change_qty(session_id, product_id, 1))
     elif action == "decrease":
-        if cart[product_id]["qty"] <= 1:
-            cart[product_id]["qty"] = 1
-            return _updated_data()
-        else:
-            cart[product_id]["qty"] -= 1
-            return _updated_data()
+        return _updated_data(*await session_store.change_qty(session_id, product_id, -1))
     elif action == "remove":
-        del session_data[session_id]["cart"][product_id]
-        df_cart = get_cart(session_id, db=db)
-        logger.debug(df_cart)
+        await session_store.remove_from_cart(session_id, product_id)
+        df_cart = await get_cart(session_id)
+        sampled_logger.debug("Cart: {}", df_cart)
         context = dict(
             cart=df_cart.to_dicts(),
             total_price=f"{df_cart['total_price'].sum():,.0f}"
@@ -508,10 +665,8 @@ async def cart_item_change_count(
 
 @app.post("/cart/clear", response_class=HTMLResponse)
 async def clear_cart(request: Request, response: Response):
-    session_id = request.cookies.get(SESSION_COOKIE_NAME)
-    cart = session_data[session_id]["cart"]
-    if cart:
-        del session_data[session_id]["cart"]
+    session_id = await require_session(request)
+    await session_store.clear_cart(session_id)
     response = templates.TemplateResponse(
         request=request,
         # name="cart/partials/cart.html",
@@ -522,13 +677,11 @@ async def clear_cart(request: Request, response: Response):
 
 
 @app.get("/cart/checkout", response_class=HTMLResponse)
-async def checkout(
-    request: Request, response: Response, db: Session = Depends(get_local_db)
-):
+async def checkout(request: Request, response: Response):
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
-    df_cart = get_cart(session_id, db=db)
-    item_count = df_cart["qty"].sum()
-    total_price = df_cart["total_price"].sum()
+    totals = await session_store.cart_totals(session_id)
+    item_count = totals["total_items"]
+    total_price = totals["total_price"]
 
     account_info = {
         "bank": "HANA BANK",
@@ -550,8 +703,8 @@ async def checkout(
 @app.get("/cart/checkout/confirm", response_class=HTMLResponse)
 async def checkout_confirm(request: Request, response: Response):
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
-    if session_id and session_id in session_data:
-        del session_data[session_id]
+    if session_id:
+        await session_store.delete(session_id)
     # Create a response with cache-control headers to prevent back navigation
     response = response(status_code=204)
     # response = templates.TemplateResponse(request=request, name="index.html")
@@ -570,20 +723,19 @@ async def checkout_confirm(request: Request, response: Response):
 async def upload_image(
     request: Request,
     response: Response,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_local_db),
+    db: AsyncSession = Depends(get_local_async_db),
 ):
     if not request.headers.get("HX-Request"):
         response = templates.TemplateResponse(request=request, name="index.html")
         return response
 
-    session_id, response = get_or_create_session(request=request, response=response)
+    session_id, response = await get_or_create_session(request=request, response=response)
     url = request.headers.get("HX-Current-URL").split("/")[-1]
     if url == "cart":
-        logger.debug(session_data[session_id])
-        q = session_data[session_id]["search_history"][-1]
-        products_search = search_product_by_keyword(q, db)
-        products = get_cart(session_id, db=db)
+        search_history = await session_store.search_history(session_id)
+        q = search_history[-1] if search_history else ""
+        products_search = await search_product_by_keyword(q, db)
+        products = await get_cart(session_id)
         context = dict(
             products=products_search.to_dicts(),
             total_price=products["total_price"].sum(),
@@ -593,13 +745,9 @@ async def upload_image(
             request=request, name="index.html", context=context
         )
 
-    with NamedTemporaryFile(delete=True, suffix=".jpg") as temp_file:
-        file_path = temp_file.name
-        logger.debug(file_path)
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-            df_prediction = get_prediction_result(file_path)
-            logger.debug(df_prediction)
+    image_bytes = await read_upload(request)
+    df_prediction = await get_cached_prediction(image_bytes, get_prediction_result)
+    sampled_logger.debug("Prediction: {}", df_prediction)
 
     context = {"request": request, "products": {}}
     if df_prediction is None:
@@ -614,39 +762,35 @@ async def upload_image(
             "index.html", context=context, block_name="result_list"
         )
 
-    dfs_queried = []
-    for product in df_prediction.to_dicts():
-        logger.debug(product)
-        keywords = product.get("keywords")
-        found = False
-        for keyword in keywords:
-            df = search_product_by_keyword(keyword, db=db)
-            session_data[session_id]["search_history"].append(keyword)
-            logger.debug(df)
-            if not df.is_empty():
-                dfs_queried.append(df)
-                found = True
-                log_search_query(
-                    db=db,
-                    search_log=SearchLog(
-                        session_id=session_id,
-                        query=keyword,
-                        searched_at=get_now().isoformat(),
-                        items_found=len(df) if not df.is_empty() else 0,
-                    ),
-                )
-                break
-        if found:
-            continue
+    keyword_groups = [
+        product.get("keywords") or [] for product in df_prediction.to_dicts()
+    ]
+    resolved = await resolve_keywords(keyword_groups, db)
+    for keyword, _ in resolved:
+        await session_store.push_search(session_id, keyword)
+    search_log_writer.log_many(
+        [
+            SearchLog(
+                session_id=session_id,
+                query=keyword,
+                searched_at=get_now(),
+                items_found=len(df),
+            )
+            for keyword, df in resolved
+        ]
+    )
 
-    logger.debug(session_data[session_id]["search_history"])
-    logger.debug(f"{session_id}: {session_data[session_id]}")
 
     # IF NOT FOUND, SPLIT ALL THE KEYWORD FOR EACH WORD AND START SEAARCH AGAIN
 
-    df_result = pl.concat(dfs_queried, how="vertical_relaxed")
+    df_result = (
+        pl.concat([df for _, df in resolved], how="diagonal_relaxed")
+        .unique(subset="id", keep="first", maintain_order=True)
+        if resolved
+        else pl.DataFrame()
+    )
     products = df_result.to_dicts()
-    logger.debug(df_result)
+    sampled_logger.debug("Upload results: {}", df_result)
 
     # TODO: Log not found image
     # if df_result.is_empty():
@@ -668,13 +812,86 @@ async def upload_image(
     return response
 
 @app.get("/catalog", response_class=HTMLResponse)
-def get_catalog(request: Request, response: Response, db: Session = Depends(get_local_db)):
-    products = search_product_by_keyword("CATALOG", db).sort("name")
-    context = {"request": request, "products": products.to_dicts()}
+def view_catalog(
+    request: Request,
+    response: Response,
+    category_id: int | None = Query(None),
+    after_name: str | None = Query(None),
+    after_id: int | None = Query(None),
+):
+    etag = catalog_etag(request)
+    if etag_matches(request, etag):
+        return set_etag(Response(status_code=304), etag)
+
+    catalog = get_catalog()
+    after = (after_name, after_id) if after_name is not None and after_id is not None else None
+    products, next_cursor = catalog.page(after, CATALOG_PAGE_SIZE, category_id)
+
+    next_page_url = None
+    if next_cursor is not None:
+        params = {"after_name": next_cursor[0], "after_id": next_cursor[1]}
+        if category_id is not None:
+            params["category_id"] = category_id
+        next_page_url = f"/catalog?{urlencode(params)}"
+
+    context = {
+        "request": request,
+        "products": products.select(SEARCH_COLUMNS).to_dicts(),
+        "next_page_url": next_page_url,
+        "categories": catalog.categories,
+        "category_id": category_id,
+    }
+    if after is not None:
+        # Infinite scroll: only the next cards and the new sentinel
+        response = templates.TemplateResponse(
+            "index.html", context=context, block_name="product_cards"
+        )
+        return set_etag(response, etag)
     response = templates.TemplateResponse(
         "index.html", context=context
     )
-    return response
+    return set_etag(response, etag)
+
+@app.get("/images/{name}")
+async def product_image(name: str):
+    """Resized WebP/AVIF product images; names carry a hash of the original."""
+    path, current = await asyncio.to_thread(get_derivative, name, get_catalog().image_paths)
+    if path is not None:
+        return FileResponse(
+            path, headers={"Cache-Control": "public, max-age=31536000, immutable"}
+        )
+    if current is not None:
+        # The original changed after this URL was rendered
+        return RedirectResponse(url=f"{DERIVED_IMAGE_URL}/{current}", status_code=307)
+    raise HTTPException(status_code=404, detail="Image not found")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint; nginx keeps it off the public site."""
+    return metrics_response()
+
+
+@app.get("/profiles", include_in_schema=False)
+async def profiles(request: Request):
+    """Index of stored request profiles, for holders of the profile token."""
+    if not token_matches(request.headers.get("X-Profile-Token")):
+        raise HTTPException(status_code=404)
+    return [
+        {**profile, "url": f"/profiles/{profile['name']}"}
+        for profile in await asyncio.to_thread(list_profiles)
+    ]
+
+
+@app.get("/profiles/{name}", include_in_schema=False)
+async def profile(request: Request, name: str):
+    if not token_matches(request.headers.get("X-Profile-Token")):
+        raise HTTPException(status_code=404)
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
 
 @app.get("/contact", response_class=HTMLResponse)
 def contact(request: Request, response: Response):
@@ -0,0 +1,11 @@
+-- Trigram-indexed search text so keyword and fuzzy search can use an index
+-- instead of a sequential scan over the concatenated product columns.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS search_text TEXT GENERATED ALWAYS AS (
+    lower(COALESCE(name, '') || ' ' || COALESCE(brand, '') || ' ' || COALESCE(keyword, ''))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_text_trgm
+ON products USING gin (search_text gin_trgm_ops);
@@ -0,0 +1,21 @@
+-- Display forms of name and image_url, computed once on write instead of on
+-- every query result. The image rule matches the original app logic: fall
+-- back to the barcode image, and local images are stored without extension.
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS display_name TEXT GENERATED ALWAYS AS (
+    initcap(name)
+) STORED;
+
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS display_image_url TEXT GENERATED ALWAYS AS (
+    CASE
+        WHEN image_url IS NULL AND barcode IS NOT NULL
+            THEN '/static/images/' || barcode || '.png'
+        WHEN image_url LIKE '/static/images%'
+            THEN image_url || '.png'
+        ELSE image_url
+    END
+) STORED;
+
+-- Adding columns does not fire the products trigger; make running workers reload
+UPDATE catalog_version SET version = version + 1, updated_at = now();
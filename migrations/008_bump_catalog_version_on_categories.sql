@@ -0,0 +1,6 @@
+-- The catalog snapshot and the /catalog ETag include categories, so a
+-- category change must invalidate them just like a product change.
+DROP TRIGGER IF EXISTS categories_bump_catalog_version ON categories;
+CREATE TRIGGER categories_bump_catalog_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
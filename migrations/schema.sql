@@ -17,10 +17,50 @@ SET xmloption = content;
 SET client_min_messages = warning;
 SET row_security = off;
 
+--
+-- Name: pg_trgm; Type: EXTENSION; Schema: -; Owner: -
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+
+--
+-- Name: EXTENSION pg_trgm; Type: COMMENT; Schema: -; Owner: -
+--
+
+COMMENT ON EXTENSION pg_trgm IS 'text similarity measurement and index searching based on trigrams';
+
+
+--
+-- Name: bump_catalog_version(); Type: FUNCTION; Schema: public; Owner: -
+--
+
+CREATE FUNCTION public.bump_catalog_version() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE catalog_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$;
+
+
 SET default_tablespace = '';
 
 SET default_table_access_method = heap;
 
+--
+-- Name: catalog_version; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.catalog_version (
+    id boolean DEFAULT true NOT NULL,
+    version bigint DEFAULT 0 NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT catalog_version_id_check CHECK (id)
+);
+
+
 --
 -- Name: categories; Type: TABLE; Schema: public; Owner: -
 --
@@ -177,7 +217,15 @@ CREATE TABLE public.products (
     created_at timestamp with time zone,
     updated_at timestamp with time zone,
     purchase_price integer,
-    latest_price integer
+    latest_price integer,
+    search_text text GENERATED ALWAYS AS (lower(((((COALESCE(name, ''::character varying))::text || ' '::text) || (COALESCE(brand, ''::character varying))::text) || ' '::text) || (COALESCE(keyword, ''::character varying))::text))) STORED,
+    display_name text GENERATED ALWAYS AS (initcap((name)::text)) STORED,
+    display_image_url text GENERATED ALWAYS AS (
+CASE
+    WHEN ((image_url IS NULL) AND (barcode IS NOT NULL)) THEN (('/static/images/'::text || (barcode)::text) || '.png'::text)
+    WHEN (image_url ~~ '/static/images%'::text) THEN (image_url || '.png'::text)
+    ELSE image_url
+END) STORED
 );
 
 
@@ -296,6 +344,14 @@ ALTER TABLE ONLY public.products ALTER COLUMN id SET DEFAULT nextval('public.pro
 ALTER TABLE ONLY public.search_logs ALTER COLUMN id SET DEFAULT nextval('public.search_logs_id_seq'::regclass);
 
 
+--
+-- Name: catalog_version catalog_version_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.catalog_version
+    ADD CONSTRAINT catalog_version_pkey PRIMARY KEY (id);
+
+
 --
 -- Name: categories categories_name_key; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -419,6 +475,13 @@ CREATE INDEX idx_order_items_product_id ON public.order_items USING btree (produ
 CREATE INDEX idx_products_category_id ON public.products USING btree (category_id);
 
 
+--
+-- Name: idx_products_search_text_trgm; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_products_search_text_trgm ON public.products USING gin (search_text public.gin_trgm_ops);
+
+
 --
 -- Name: idx_search_logs_searched_at; Type: INDEX; Schema: public; Owner: -
 --
@@ -454,6 +517,20 @@ CREATE INDEX products_index_1 ON public.products USING btree (name);
 CREATE INDEX products_index_2 ON public.products USING btree (barcode);
 
 
+--
+-- Name: categories categories_bump_catalog_version; Type: TRIGGER; Schema: public; Owner: -
+--
+
+CREATE TRIGGER categories_bump_catalog_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.categories FOR EACH STATEMENT EXECUTE FUNCTION public.bump_catalog_version();
+
+
+--
+-- Name: products products_bump_catalog_version; Type: TRIGGER; Schema: public; Owner: -
+--
+
+CREATE TRIGGER products_bump_catalog_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.products FOR EACH STATEMENT EXECUTE FUNCTION public.bump_catalog_version();
+
+
 --
 -- PostgreSQL database dump complete
 --
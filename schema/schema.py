@@ -1,9 +1,11 @@
+import datetime
+
 from pydantic import BaseModel, Field
 
 class SearchLog(BaseModel):
     session_id: str
     query: str
-    searched_at: str
+    searched_at: datetime.datetime
     items_found: int = 0
 
 
@@ -0,0 +1,184 @@
+import bisect
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import polars as pl
+from loguru import logger
+from sqlalchemy import text
+
+from db.database import SessionLocal_local_db
+from services.fuzzy_index import FuzzyIndex
+from services.image_derivatives import build_image_index
+
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "10"))
+
+CATALOG_QUERY = """
+    SELECT id, barcode, display_name AS name, brand, keyword, price, unit, stock,
+           description, category_id, display_image_url AS image_url,
+           created_at, updated_at
+    FROM products
+    ORDER BY id
+"""
+CATEGORIES_QUERY = "SELECT id, name FROM categories ORDER BY name"
+VERSION_QUERY = "SELECT version FROM catalog_version"
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable, versioned view of the products table."""
+
+    version: int
+    products: pl.DataFrame
+    id_to_row: dict[int, int] = field(repr=False)
+    fuzzy: FuzzyIndex = field(repr=False)
+    categories: list[tuple[int, str]] = field(default_factory=list)
+    # Keyset indexes for the catalog pages: (name, id) keys in display order
+    # and the matching rows, for all products (None) and per category
+    name_order: dict[int | None, tuple[list[tuple[str, int]], list[int]]] = field(
+        default_factory=dict, repr=False
+    )
+    # image_url -> srcset per format, and derived stem -> original; both
+    # computed off the event loop at load time
+    image_sources: dict[str, dict[str, str]] = field(default_factory=dict, repr=False)
+    image_paths: dict[str, Path] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pl.DataFrame,
+        version: int,
+        previous: "CatalogSnapshot | None" = None,
+        categories: dict[int, str] | None = None,
+    ) -> "CatalogSnapshot":
+        df = df.with_columns(
+            search_text=pl.concat_str(
+                ["name", "brand", "keyword"], separator=" ", ignore_nulls=True
+            ).str.to_lowercase()
+        )
+        ids = df["id"].to_list()
+        texts = dict(zip(ids, df["search_text"].to_list()))
+        if previous is not None:
+            fuzzy = previous.fuzzy.updated(texts)
+        else:
+            fuzzy = FuzzyIndex.build(texts)
+
+        names = df["name"].to_list()
+        category_ids = df["category_id"].to_list()
+        name_order = {None: ([], [])}
+        for row in sorted(range(len(ids)), key=lambda row: (names[row], ids[row])):
+            groups = (None,) if category_ids[row] is None else (None, category_ids[row])
+            for group in groups:
+                keys, rows = name_order.setdefault(group, ([], []))
+                keys.append((names[row], ids[row]))
+                rows.append(row)
+        categories = categories or {}
+        listed = [
+            (category_id, name)
+            for category_id, name in categories.items()
+            if category_id in name_order
+        ]
+        image_sources, image_paths = build_image_index(
+            df["image_url"].drop_nulls().unique()
+        )
+        return cls(
+            version=version,
+            products=df,
+            id_to_row={product_id: row for row, product_id in enumerate(ids)},
+            fuzzy=fuzzy,
+            categories=listed,
+            name_order=name_order,
+            image_sources=image_sources,
+            image_paths=image_paths,
+        )
+
+    def __len__(self) -> int:
+        return self.products.height
+
+    def rows(self, rows: list[int]) -> pl.DataFrame:
+        return self.products[rows]
+
+    def by_ids(self, ids: list[int]) -> pl.DataFrame:
+        rows = [self.id_to_row[i] for i in ids if i in self.id_to_row]
+        return self.rows(rows)
+
+    def product(self, product_id: int) -> dict | None:
+        row = self.id_to_row.get(product_id)
+        return None if row is None else self.products.row(row, named=True)
+
+    def page(
+        self,
+        after: tuple[str, int] | None = None,
+        limit: int = 24,
+        category_id: int | None = None,
+    ) -> tuple[pl.DataFrame, tuple[str, int] | None]:
+        """Keyset page of products ordered by (name, id).
+
+        Returns the page and the cursor for the next one, or None on the last page.
+        """
+        keys, rows = self.name_order.get(category_id, ([], []))
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        end = start + limit
+        next_cursor = keys[end - 1] if end < len(keys) else None
+        return self.rows(rows[start:end]), next_cursor
+
+    def search(self, keyword: str) -> pl.DataFrame:
+        """Case-insensitive substring match, same semantics as the ILIKE query."""
+        return self.products.filter(
+            pl.col("search_text").str.contains(keyword.lower(), literal=True)
+        )
+
+    def fuzzy_search(
+        self, keyword: str, limit: int = 6, score_cutoff: float = 60
+    ) -> pl.DataFrame:
+        """Fuzzy match via the prebuilt index, best score first."""
+        matches = self.fuzzy.search(keyword, limit=limit, score_cutoff=score_cutoff)
+        if not matches:
+            return pl.DataFrame()
+        rows = [self.id_to_row[product_id] for product_id, _ in matches]
+        scores = [score for _, score in matches]
+        return self.rows(rows).with_columns(score=pl.Series(scores))
+
+
+_snapshot: CatalogSnapshot | None = None
+_reload_lock = threading.Lock()
+
+
+def _read_version(db) -> int:
+    return db.execute(text(VERSION_QUERY)).scalar_one()
+
+
+def load_catalog(db, previous: CatalogSnapshot | None = None) -> CatalogSnapshot:
+    version = _read_version(db)
+    df = pl.read_database(query=CATALOG_QUERY, connection=db, infer_schema_length=None)
+    categories = dict(db.execute(text(CATEGORIES_QUERY)).all())
+    return CatalogSnapshot.from_frame(
+        df, version=version, previous=previous, categories=categories
+    )
+
+
+def refresh_catalog(force: bool = False) -> CatalogSnapshot:
+    """Reload the snapshot if the catalog version moved, then swap it in."""
+    global _snapshot
+    with _reload_lock:
+        with SessionLocal_local_db() as db:
+            if not force and _snapshot is not None:
+                if _read_version(db) == _snapshot.version:
+                    return _snapshot
+            snapshot = load_catalog(db, previous=_snapshot)
+        _snapshot = snapshot
+    logger.info(f"Catalog snapshot v{snapshot.version} loaded ({len(snapshot)} products)")
+    return snapshot
+
+
+def get_catalog() -> CatalogSnapshot:
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = refresh_catalog()
+    return snapshot
+
+
+def image_sources(image_url: str | None) -> dict[str, str] | None:
+    """Template helper: the snapshot's precomputed srcsets for a product image."""
+    return get_catalog().image_sources.get(image_url)
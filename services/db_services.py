@@ -1,32 +1,131 @@
 
-from sqlalchemy.orm import Session
+import polars as pl
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from schema.schema import SearchLog
-from loguru import logger
 
-def log_search_query(db: Session, search_log: SearchLog):
-    """ Log a search query to the database."""
+FUZZY_SEARCH_LIMIT = 6
 
-# class SearchLog(BaseModel):
-#     session_id: str
-#     query: str
-#     searched_at: str
-#     items_found: int = 0
+# Exact substring hits win; only when there are none do the best trigram
+# matches (word_similarity over the pg_trgm GIN index) come back instead.
+SEARCH_PRODUCTS_QUERY = text("""
+    WITH candidates AS (
+        SELECT id, barcode, display_name AS name, price, unit,
+               display_image_url AS image_url,
+               search_text ILIKE :pattern AS is_exact,
+               word_similarity(:keyword, search_text) AS score
+        FROM products
+        WHERE search_text ILIKE :pattern OR :keyword <% search_text
+    )
+    (
+        SELECT id, barcode, name, price, unit, image_url, score
+        FROM candidates
+        WHERE is_exact
+    )
+    UNION ALL
+    (
+        SELECT id, barcode, name, price, unit, image_url, score
+        FROM candidates
+        WHERE NOT EXISTS (SELECT 1 FROM candidates WHERE is_exact)
+        ORDER BY score DESC
+        LIMIT :fuzzy_limit
+    )
+""")
+
+
+# Same ranking as SEARCH_PRODUCTS_QUERY, evaluated for many keywords in one
+# round trip; `ord` is the keyword's position in the input array.
+SEARCH_PRODUCTS_BATCH_QUERY = text("""
+    SELECT k.ord, c.id, c.barcode, c.name, c.price, c.unit, c.image_url, c.score
+    FROM unnest(CAST(:keywords AS text[]), CAST(:patterns AS text[]))
+         WITH ORDINALITY AS k(keyword, pattern, ord)
+    CROSS JOIN LATERAL (
+        SELECT m.*,
+               bool_or(m.is_exact) OVER () AS any_exact,
+               row_number() OVER (ORDER BY m.score DESC) AS fuzzy_rank
+        FROM (
+            SELECT p.id, p.barcode, p.display_name AS name, p.price, p.unit,
+                   p.display_image_url AS image_url,
+                   p.search_text ILIKE k.pattern AS is_exact,
+                   word_similarity(k.keyword, p.search_text) AS score
+            FROM products p
+            WHERE p.search_text ILIKE k.pattern OR k.keyword <% p.search_text
+        ) m
+    ) c
+    WHERE c.is_exact OR (NOT c.any_exact AND c.fuzzy_rank <= :fuzzy_limit)
+""")
+
+
+def _escape_like(keyword: str) -> str:
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def read_frame(db: AsyncSession, query, params: dict | None = None) -> pl.DataFrame:
+    """Run a query on the async session and collect the rows into a DataFrame."""
+    result = await db.execute(query, params or {})
+    return pl.DataFrame(
+        result.all(), schema=list(result.keys()), orient="row", infer_schema_length=None
+    )
+
+
+async def search_products(db: AsyncSession, keyword: str) -> pl.DataFrame:
+    """Search products in Postgres through the trigram index."""
+    keyword = keyword.strip().lower()
+    df = await read_frame(
+        db,
+        SEARCH_PRODUCTS_QUERY,
+        {
+            "keyword": keyword,
+            "pattern": f"%{_escape_like(keyword)}%",
+            "fuzzy_limit": FUZZY_SEARCH_LIMIT,
+        },
+    )
+    if df.is_empty():
+        return pl.DataFrame()
+    return df
+
+
+async def search_products_batch(db: AsyncSession, keywords: list[str]) -> dict[str, pl.DataFrame]:
+    """Search several keywords in a single query; keywords without hits are omitted."""
+    normalized = [keyword.strip().lower() for keyword in keywords]
+    df = await read_frame(
+        db,
+        SEARCH_PRODUCTS_BATCH_QUERY,
+        {
+            "keywords": normalized,
+            "patterns": [f"%{_escape_like(keyword)}%" for keyword in normalized],
+            "fuzzy_limit": FUZZY_SEARCH_LIMIT,
+        },
+    )
+    if df.is_empty():
+        return {}
+    return {
+        keywords[ord - 1]: group.drop("ord")
+        for (ord,), group in df.group_by("ord", maintain_order=True)
+    }
+
+
+async def log_search_queries(db: AsyncSession, search_logs: list[SearchLog]):
+    """Log several search queries in one statement; raises if the insert fails."""
+    if not search_logs:
+        return
     query = text("""
         INSERT INTO search_logs (session_id, query, searched_at, items_found)
-        VALUES (:session_id, :query, :searched_at, :items_found)
+        SELECT * FROM unnest(
+            CAST(:session_ids AS uuid[]),
+            CAST(:queries AS text[]),
+            CAST(:searched_ats AS timestamptz[]),
+            CAST(:items_founds AS integer[])
+        )
     """)
     try:
-        db.execute(query, {
-            "session_id": search_log.session_id,
-            "query": search_log.query,
-            "searched_at": search_log.searched_at,
-            "items_found": search_log.items_found
+        await db.execute(query, {
+            "session_ids": [search_log.session_id for search_log in search_logs],
+            "queries": [search_log.query for search_log in search_logs],
+            "searched_ats": [search_log.searched_at for search_log in search_logs],
+            "items_founds": [search_log.items_found for search_log in search_logs],
         })
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error logging search query: {e}")
-        return None
-
-    return search_log
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
@@ -0,0 +1,73 @@
+import gzip
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Request, Response
+
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+FRAGMENT_GZIP_LEVEL = 6
+
+
+@dataclass(frozen=True)
+class Fragment:
+    body: bytes
+    gzipped: bytes
+    items_found: int
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzipped)
+
+    def response(self, request: Request) -> Response:
+        """Serve the precompressed body when the client takes gzip."""
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return Response(
+                self.gzipped,
+                media_type="text/html",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+            )
+        return Response(self.body, media_type="text/html")
+
+
+class FragmentCache:
+    """LRU of rendered HTML fragments, bounded by the bytes they hold.
+
+    Keys should include the catalog version, so a catalog change makes the
+    old entries unreachable and they age out through the LRU.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[tuple, Fragment] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: tuple) -> Fragment | None:
+        fragment = self.entries.get(key)
+        if fragment is not None:
+            self.entries.move_to_end(key)
+        return fragment
+
+    def put(self, key: tuple, body: bytes, items_found: int) -> Fragment:
+        fragment = Fragment(
+            body=body,
+            gzipped=gzip.compress(body, compresslevel=FRAGMENT_GZIP_LEVEL),
+            items_found=items_found,
+        )
+        if fragment.size > self.max_bytes:
+            return fragment
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size
+        self.entries[key] = fragment
+        self.size += fragment.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+        return fragment
+
+
+fragment_cache = FragmentCache(max_bytes=FRAGMENT_CACHE_MAX_BYTES)
@@ -0,0 +1,93 @@
+from collections import Counter
+
+from rapidfuzz import fuzz, process, utils
+
+NGRAM_SIZE = 3
+SHORTLIST_SIZE = 100
+
+
+def _ngrams(text: str, n: int = NGRAM_SIZE) -> set[str]:
+    padded = f" {text} "
+    return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+
+class FuzzyIndex:
+    """Preprocessed fuzzy-search choices with an n-gram candidate prefilter.
+
+    Choices are keyed by product id. `updated` returns a new index that shares
+    every untouched posting list with this one, so a catalog refresh only pays
+    for the products that actually changed and readers of the old index are
+    never mutated under their feet.
+    """
+
+    def __init__(self, choices: dict[int, str], postings: dict[str, set[int]]):
+        self.choices = choices
+        self.postings = postings
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    @classmethod
+    def build(cls, texts: dict[int, str]) -> "FuzzyIndex":
+        return cls({}, {}).updated(texts)
+
+    def updated(self, texts: dict[int, str]) -> "FuzzyIndex":
+        """Return an index over `texts`, reusing entries that did not change."""
+        choices = dict(self.choices)
+        postings = dict(self.postings)
+        touched: set[str] = set()
+
+        def _copy_on_write(gram: str) -> set[int]:
+            if gram not in touched:
+                postings[gram] = set(postings.get(gram, ()))
+                touched.add(gram)
+            return postings[gram]
+
+        for product_id in self.choices.keys() - texts.keys():
+            for gram in _ngrams(choices.pop(product_id)):
+                _copy_on_write(gram).discard(product_id)
+
+        for product_id, text in texts.items():
+            processed = utils.default_process(text or "")
+            previous = choices.get(product_id)
+            if previous == processed:
+                continue
+            if previous is not None:
+                for gram in _ngrams(previous):
+                    _copy_on_write(gram).discard(product_id)
+            choices[product_id] = processed
+            for gram in _ngrams(processed):
+                _copy_on_write(gram).add(product_id)
+
+        for gram in touched:
+            if not postings[gram]:
+                del postings[gram]
+        return FuzzyIndex(choices, postings)
+
+    def candidates(self, processed_query: str) -> list[int]:
+        grams = _ngrams(processed_query)
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.postings.get(gram, ()))
+        return [product_id for product_id, _ in hits.most_common(SHORTLIST_SIZE)]
+
+    def search(
+        self, query: str, limit: int = 6, score_cutoff: float = 60
+    ) -> list[tuple[int, float]]:
+        """Return `(product_id, score)` pairs, best first."""
+        processed_query = utils.default_process(query)
+        if not processed_query:
+            return []
+        shortlist = {
+            product_id: self.choices[product_id]
+            for product_id in self.candidates(processed_query)
+        }
+        results = process.extract(
+            processed_query,
+            shortlist,
+            scorer=fuzz.WRatio,
+            processor=None,
+            limit=limit,
+            score_cutoff=score_cutoff,
+        )
+        return [(product_id, score) for _, score, product_id in results]
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+
+import polars as pl
+from loguru import logger
+from PIL import Image
+from redis.exceptions import RedisError
+
+from db.redis_client import get_redis
+
+PREDICTION_CACHE_TTL_SECONDS = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", str(3 * 24 * 3600)))
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "1024"))
+PREDICTION_CACHE_MAX_DISTANCE = int(os.getenv("PREDICTION_CACHE_MAX_DISTANCE", "5"))
+
+HASH_SIZE = 8
+# 8 bands of 8 bits: any two hashes within 7 bits share at least one band
+BANDS = 8
+BAND_BITS = HASH_SIZE * HASH_SIZE // BANDS
+REDIS_PREFIX = "ikmimart:prediction"
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash of the downscaled grayscale image."""
+    small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def hash_image_bytes(image_bytes: bytes) -> int:
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.draft("L", (64, 64))
+        return perceptual_hash(img)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bands(value: int) -> list[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def _dumps(df: pl.DataFrame) -> str:
+    return json.dumps(df.to_dicts())
+
+
+def _loads(payload: str | bytes) -> pl.DataFrame:
+    return pl.DataFrame(json.loads(payload))
+
+
+class MemoryPredictionCache:
+    """In-process LRU with TTL; near-duplicates found by a linear Hamming scan."""
+
+    def __init__(self, max_entries: int, ttl: int, max_distance: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: OrderedDict[int, tuple[float, str]] = OrderedDict()
+
+    async def get(self, phash: int) -> pl.DataFrame | None:
+        now = time.monotonic()
+        best, best_distance = None, self.max_distance + 1
+        for key, (expires_at, _) in list(self._entries.items()):
+            if expires_at <= now:
+                del self._entries[key]
+                continue
+            distance = hamming(phash, key)
+            if distance < best_distance:
+                best, best_distance = key, distance
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return _loads(self._entries[best][1])
+
+    async def set(self, phash: int, df: pl.DataFrame):
+        self._entries[phash] = (time.monotonic() + self.ttl, _dumps(df))
+        self._entries.move_to_end(phash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RedisPredictionCache:
+    """Redis-backed cache; band sets index hashes for near-duplicate lookup.
+
+    Entries expire through native key TTLs and Redis' allkeys-lru policy
+    handles eviction under memory pressure. Band members are scored by
+    their entry's expiry time and pruned on write, so a busy band does not
+    keep members whose entries are long gone.
+    """
+
+    def __init__(self, client, ttl: int, max_distance: int):
+        self.client = client
+        self.ttl = ttl
+        self.max_distance = max_distance
+
+    def _entry_key(self, phash: int) -> str:
+        return f"{REDIS_PREFIX}:entry:{phash:016x}"
+
+    def _band_key(self, band: int, value: int) -> str:
+        # Sorted set of entry hashes sharing this band value, scored by expiry
+        return f"{REDIS_PREFIX}:band:{band}:{value:02x}"
+
+    async def get(self, phash: int) -> pl.DataFrame | None:
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for i, value in enumerate(_bands(phash)):
+                pipe.zrangebyscore(self._band_key(i, value), now, "+inf")
+            bands = await pipe.execute()
+        candidates = {int(c, 16) for members in bands for c in members}
+        ranked = sorted((hamming(phash, c), c) for c in candidates)
+        for distance, candidate in ranked:
+            if distance > self.max_distance:
+                break
+            payload = await self.client.get(self._entry_key(candidate))
+            if payload is not None:
+                return _loads(payload)
+        return None
+
+    async def set(self, phash: int, df: pl.DataFrame):
+        member = f"{phash:016x}"
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self._entry_key(phash), _dumps(df), ex=self.ttl)
+            for i, value in enumerate(_bands(phash)):
+                band_key = self._band_key(i, value)
+                pipe.zremrangebyscore(band_key, "-inf", now)
+                pipe.zadd(band_key, {member: now + self.ttl})
+                pipe.expire(band_key, self.ttl)
+            await pipe.execute()
+
+
+class PredictionCache:
+    """Uses Redis when configured and reachable, in-process storage otherwise."""
+
+    def __init__(self):
+        self.memory = MemoryPredictionCache(
+            PREDICTION_CACHE_MAX_ENTRIES,
+            PREDICTION_CACHE_TTL_SECONDS,
+            PREDICTION_CACHE_MAX_DISTANCE,
+        )
+        client = get_redis()
+        self.redis = (
+            RedisPredictionCache(client, PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_MAX_DISTANCE)
+            if client is not None
+            else None
+        )
+
+    async def get(self, phash: int) -> pl.DataFrame | None:
+        if self.redis is not None:
+            try:
+                return await self.redis.get(phash)
+            except RedisError as e:
+                logger.warning(f"Prediction cache unavailable, using memory: {e}")
+        return await self.memory.get(phash)
+
+    async def set(self, phash: int, df: pl.DataFrame):
+        if self.redis is not None:
+            try:
+                return await self.redis.set(phash, df)
+            except RedisError as e:
+                logger.warning(f"Prediction cache unavailable, using memory: {e}")
+        await self.memory.set(phash, df)
+
+
+prediction_cache = PredictionCache()
+
+
+async def get_cached_prediction(image_bytes: bytes, predict) -> pl.DataFrame | None:
+    """Return the cached prediction for a near-identical image or call `predict`.
+
+    Images Pillow cannot decode skip the cache and go straight to `predict`.
+    """
+    try:
+        phash = await asyncio.to_thread(hash_image_bytes, image_bytes)
+    except Exception as e:
+        logger.warning(f"Could not hash uploaded image, skipping cache: {e!r}")
+        return await predict(image_bytes)
+    df = await prediction_cache.get(phash)
+    if df is not None:
+        logger.info(f"Prediction cache hit for {phash:016x}")
+        return df
+    df = await predict(image_bytes)
+    if df is not None and not df.is_empty():
+        await prediction_cache.set(phash, df)
+    return df
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from loguru import logger
+from PIL import Image, features
+
+# Prefix of local product images; display_image_url (migration 007) builds on it
+PRODUCT_IMAGE_URL = "/static/images"
+IMAGE_SOURCE_DIR = Path(os.getenv("IMAGE_SOURCE_DIR", "static/images"))
+DERIVED_IMAGE_DIR = Path(os.getenv("DERIVED_IMAGE_DIR", "static/derived"))
+DERIVED_IMAGE_URL = "/images"
+IMAGE_WIDTHS = (160, 320, 640)
+# AVIF first: browsers take the first <source> they support
+IMAGE_FORMATS = tuple(fmt for fmt in ("avif", "webp") if features.check(fmt))
+IMAGE_QUALITY = {"avif": 50, "webp": 75}
+DIGEST_SIZE = 8
+
+DERIVED_NAME = re.compile(
+    r"^(?P<stem>[\w.-]+)-(?P<digest>[0-9a-f]{16})-(?P<width>\d+)\.(?P<fmt>[a-z]+)$"
+)
+
+# source path -> ((mtime_ns, size), (digest, (width, height))); re-read only
+# when the file changes
+_sources: dict[Path, tuple[tuple[int, int], tuple[str, tuple[int, int]]]] = {}
+
+
+def source_path(image_url: str | None) -> Path | None:
+    """Map a product image URL to the local original, if it is one of ours."""
+    if not image_url or not image_url.startswith(PRODUCT_IMAGE_URL + "/"):
+        return None
+    name = image_url.removeprefix(PRODUCT_IMAGE_URL + "/")
+    if "/" in name:
+        return None
+    return IMAGE_SOURCE_DIR / name
+
+
+def source_info(path: Path) -> tuple[str, tuple[int, int]] | None:
+    """Content digest and pixel size of an original, or None if it is unreadable."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _sources.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    data = path.read_bytes()
+    try:
+        # Only the header is parsed here
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+    except OSError:
+        return None
+    info = (hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest(), size)
+    _sources[path] = (key, info)
+    return info
+
+
+def source_digest(path: Path) -> str | None:
+    info = source_info(path)
+    return None if info is None else info[0]
+
+
+def derived_name(path: Path, digest: str, width: int, fmt: str) -> str:
+    return f"{path.stem}-{digest}-{width}.{fmt}"
+
+
+def derived_width(size: tuple[int, int], box: int) -> int:
+    """Width of the derivative that fits `size` into a `box` square; never upscaled."""
+    width, height = size
+    if width <= box and height <= box:
+        return width
+    return max(1, round(width * min(box / width, box / height)))
+
+
+def image_sources(image_url: str | None) -> dict[str, str] | None:
+    """`srcset` strings per format for a product image, or None if there are none.
+
+    Reads the original from disk, so it is meant for the catalog refresher
+    (see build_image_index), not for request handling. Descriptors carry
+    the real derivative width; boxes larger than the original collapse into
+    one entry.
+    """
+    path = source_path(image_url)
+    if path is None or not IMAGE_FORMATS:
+        return None
+    info = source_info(path)
+    if info is None:
+        return None
+    digest, size = info
+    widths = {}
+    for box in IMAGE_WIDTHS:
+        widths.setdefault(derived_width(size, box), box)
+    return {
+        fmt: ", ".join(
+            f"{DERIVED_IMAGE_URL}/{derived_name(path, digest, box, fmt)} {width}w"
+            for width, box in widths.items()
+        )
+        for fmt in IMAGE_FORMATS
+    }
+
+
+def build_image_index(
+    image_urls,
+) -> tuple[dict[str, dict[str, str]], dict[str, Path]]:
+    """`image_sources` keyed by URL, and the original behind each derived stem.
+
+    The stem map lets get_derivative resolve a name with a lookup instead of
+    a directory scan. Derived names only carry the stem, so when two
+    originals share one the first URL in sorted order keeps it.
+    """
+    sources, paths = {}, {}
+    for image_url in sorted(image_urls):
+        path = source_path(image_url)
+        if path is None or paths.get(path.stem, path) != path:
+            continue
+        srcsets = image_sources(image_url)
+        if srcsets is not None:
+            sources[image_url] = srcsets
+            paths[path.stem] = path
+    return sources, paths
+
+
+def render_derivative(path: Path, width: int, fmt: str, target: Path):
+    with Image.open(path) as img:
+        img.draft("RGB", (width, width))
+        if img.mode not in ("RGB", "RGBA"):
+            has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        img.thumbnail((width, width), Image.Resampling.LANCZOS)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a concurrent request never serves half a file
+        with tempfile.NamedTemporaryFile(
+            dir=target.parent, suffix=f".{fmt}", delete=False
+        ) as tmp:
+            img.save(tmp, format=fmt.upper(), quality=IMAGE_QUALITY[fmt])
+        os.replace(tmp.name, target)
+
+
+def get_derivative(name: str, paths: dict[str, Path]) -> tuple[Path | None, str | None]:
+    """Resolve a derived image name to a file on disk, rendering it on first use.
+
+    `paths` maps stems to originals (see build_image_index); other stems are
+    rejected. Returns (path, None) when the file is served, (None,
+    current_name) when the original changed since the name was issued, and
+    (None, None) when the name is not valid.
+    """
+    match = DERIVED_NAME.match(name)
+    if match is None:
+        return None, None
+    width, fmt = int(match["width"]), match["fmt"]
+    if width not in IMAGE_WIDTHS or fmt not in IMAGE_FORMATS:
+        return None, None
+    path = paths.get(match["stem"])
+    if path is None:
+        return None, None
+    digest = source_digest(path)
+    if digest is None:
+        return None, None
+    if digest != match["digest"]:
+        return None, derived_name(path, digest, width, fmt)
+
+    target = DERIVED_IMAGE_DIR / name
+    if not target.exists():
+        render_derivative(path, width, fmt, target)
+        logger.debug(f"Rendered image derivative {name}")
+    return target, None
+
+
+def build_all():
+    """Pre-render every derivative of every local product image."""
+    count = 0
+    for path in sorted(IMAGE_SOURCE_DIR.iterdir()):
+        digest = source_digest(path) if path.is_file() else None
+        if digest is None:
+            continue
+        for width in IMAGE_WIDTHS:
+            for fmt in IMAGE_FORMATS:
+                target = DERIVED_IMAGE_DIR / derived_name(path, digest, width, fmt)
+                if target.exists():
+                    continue
+                try:
+                    render_derivative(path, width, fmt, target)
+                    count += 1
+                except OSError as e:
+                    logger.error(f"Cannot render {path.name}: {e}")
+    logger.info(f"Rendered {count} image derivatives into {DERIVED_IMAGE_DIR}")
+
+
+if __name__ == "__main__":
+    build_all()
@@ -0,0 +1,52 @@
+import os
+import random
+import sys
+
+from loguru import logger
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# One JSON object per line instead of the human-readable format
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() in ("1", "true", "yes")
+# Share of high-frequency per-request records that are written
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+
+def configure_logging(sink=sys.stderr, level: str = LOG_LEVEL):
+    """Replace loguru's default handler with a single non-blocking sink.
+
+    With enqueue=True only the sink write moves to a background thread, so
+    a slow terminal or log driver does not block the event loop. Formatting
+    (and the repr of every argument) still happens in the calling thread.
+    Records below `level` return before their message is formatted, so pass
+    payloads as arguments (`logger.debug("rows: {}", df)`), not f-strings.
+    Keep large payloads at DEBUG or behind `sampled_logger` on hot paths,
+    and use `logger.opt(lazy=True)` when building the argument is itself
+    expensive.
+    """
+    logger.remove()
+    logger.add(sink, level=level, enqueue=True, serialize=LOG_JSON)
+
+
+class SampledLogger:
+    """Forwards only a `rate` share of calls to loguru.
+
+    The coin is tossed before anything is formatted, so a dropped record
+    costs one random() call.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def _log(self, level: str, message: str, *args, **kwargs):
+        if random.random() < self.rate:
+            # depth=2: report the caller of debug()/info(), not this wrapper
+            logger.opt(depth=2).log(level, message, *args, **kwargs)
+
+    def debug(self, message: str, *args, **kwargs):
+        self._log("DEBUG", message, *args, **kwargs)
+
+    def info(self, message: str, *args, **kwargs):
+        self._log("INFO", message, *args, **kwargs)
+
+
+sampled_logger = SampledLogger(LOG_SAMPLE_RATE)
@@ -0,0 +1,79 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+
+# Seconds; fine enough for in-memory search, wide enough for Gemini calls
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+
+REQUEST_SECONDS = Histogram(
+    "ikmimart_request_seconds",
+    "Request handling time by route",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "ikmimart_stage_seconds",
+    "Time spent in each stage of the request hot path",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+SESSIONS = Gauge("ikmimart_sessions", "Sessions held by the in-memory session store")
+SESSION_BYTES = Gauge(
+    "ikmimart_session_bytes", "Rough size of the in-memory session data in bytes"
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "ikmimart_db_pool_connections",
+    "Database pool connections; utilisation is checked_out / capacity",
+    ["pool", "state"],
+)
+FRAGMENT_CACHE_BYTES = Gauge(
+    "ikmimart_fragment_cache_bytes", "Bytes held by the search fragment cache"
+)
+SEARCH_LOG_QUEUE = Gauge(
+    "ikmimart_search_log_queue", "Search logs waiting to be written"
+)
+SEARCH_LOGS_DROPPED = Gauge(
+    "ikmimart_search_logs_dropped", "Search logs dropped because the queue was full"
+)
+
+
+def stage_timer(stage: str):
+    """Context manager (or decorator) recording its duration under `stage`."""
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+def watch_pool(name: str, pool, capacity: int):
+    """Report a SQLAlchemy pool's connections at scrape time."""
+    DB_POOL_CONNECTIONS.labels(name, "checked_out").set_function(pool.checkedout)
+    DB_POOL_CONNECTIONS.labels(name, "idle").set_function(pool.checkedin)
+    DB_POOL_CONNECTIONS.labels(name, "capacity").set(capacity)
+
+
+class RequestTimingMiddleware:
+    """Time every request under its route template, so ids do not become labels."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Routing fills in scope["route"]; mounts and 404s have none
+            route = getattr(scope.get("route"), "path", None)
+            if route is None:
+                route = "/static" if scope["path"].startswith("/static/") else "other"
+            REQUEST_SECONDS.labels(scope["method"], route).observe(
+                time.perf_counter() - start
+            )
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,124 @@
+import asyncio
+import datetime
+import os
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+
+from loguru import logger
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+
+# Empty token: header-triggered profiling and the index are both off
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = tuple(
+    p for p in os.getenv("PROFILE_PATHS", "/search,/upload").split(",") if p
+)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+PROFILE_HEADER = b"x-profile-token"
+PROFILE_SUFFIX = ".speedscope.json"
+
+_PROFILE_NAME = re.compile(r"^[\w.-]+\.speedscope\.json$")
+
+
+def token_matches(token: str | None) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and secrets.compare_digest(
+        token, PROFILE_TOKEN
+    )
+
+
+def profile_path(name: str) -> Path | None:
+    """The stored profile called `name`, or None if there is no such file."""
+    if not _PROFILE_NAME.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+def list_profiles() -> list[dict]:
+    """Stored profiles, newest first."""
+    if not PROFILE_DIR.is_dir():
+        return []
+    profiles = []
+    for path in PROFILE_DIR.glob(f"*{PROFILE_SUFFIX}"):
+        stat = path.stat()
+        profiles.append(
+            {
+                "name": path.name,
+                "created_at": datetime.datetime.fromtimestamp(
+                    stat.st_mtime, datetime.UTC
+                ).isoformat(),
+                "bytes": stat.st_size,
+            }
+        )
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+def save_profile(profiler: Profiler, method: str, path: str, elapsed: float) -> Path:
+    """Write a speedscope profile and drop the oldest beyond PROFILE_MAX_FILES."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S%f")
+    route = re.sub(r"[^\w]+", "_", path).strip("_") or "root"
+    target = PROFILE_DIR / f"{stamp}-{method}-{route}-{elapsed * 1000:.0f}ms{PROFILE_SUFFIX}"
+    target.write_text(profiler.output(SpeedscopeRenderer()))
+    stored = sorted(PROFILE_DIR.glob(f"*{PROFILE_SUFFIX}"))
+    for old in stored[:-PROFILE_MAX_FILES]:
+        old.unlink(missing_ok=True)
+    return target
+
+
+class RequestProfilerMiddleware:
+    """Sample the call stack of selected requests and store a speedscope profile.
+
+    A request is profiled when it carries X-Profile-Token matching
+    PROFILE_TOKEN (any path), or at random with PROFILE_SAMPLE_RATE (only
+    PROFILE_PATHS). At most PROFILE_MAX_CONCURRENT requests are profiled at
+    once. Open the files at https://www.speedscope.app or with any
+    speedscope-compatible flamegraph viewer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.active = 0
+
+    def _wanted(self, scope) -> bool:
+        # Fetching stored profiles carries the token too; don't profile that
+        if self.active >= PROFILE_MAX_CONCURRENT or scope["path"].startswith("/profiles"):
+            return False
+        token = dict(scope["headers"]).get(PROFILE_HEADER)
+        if token is not None and token_matches(token.decode("latin-1")):
+            return True
+        return (
+            PROFILE_SAMPLE_RATE > 0
+            and scope["path"].startswith(PROFILE_PATHS)
+            and random.random() < PROFILE_SAMPLE_RATE
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+        # async_mode follows this request's task across awaits, so other
+        # requests interleaved on the event loop stay out of the profile
+        profiler = Profiler(interval=PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+        self.active += 1
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            self.active -= 1
+            elapsed = time.perf_counter() - start
+            try:
+                target = await asyncio.to_thread(
+                    save_profile, profiler, scope["method"], scope["path"], elapsed
+                )
+                logger.info(f"Profiled {scope['method']} {scope['path']} -> {target.name}")
+            except Exception as e:
+                logger.error(f"Error saving request profile: {e}")
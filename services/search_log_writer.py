@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import os
+
+from loguru import logger
+
+from db.database import AsyncSessionLocal_local_db
+from schema.schema import SearchLog
+from services.db_services import log_search_queries
+
+SEARCH_LOG_QUEUE_SIZE = int(os.getenv("SEARCH_LOG_QUEUE_SIZE", "10000"))
+SEARCH_LOG_BATCH_SIZE = int(os.getenv("SEARCH_LOG_BATCH_SIZE", "500"))
+SEARCH_LOG_FLUSH_SECONDS = float(os.getenv("SEARCH_LOG_FLUSH_SECONDS", "2"))
+
+
+class SearchLogWriter:
+    """Write-behind buffer for search logs.
+
+    Requests only enqueue; a background task inserts the logs in batches
+    once SEARCH_LOG_BATCH_SIZE records are waiting or SEARCH_LOG_FLUSH_SECONDS
+    have passed. When the queue is full new records are dropped and counted
+    rather than slowing the request down. Records from a batch that fails
+    to insert are counted as dropped too.
+    """
+
+    def __init__(self, max_size: int, batch_size: int, flush_seconds: float):
+        self.queue: asyncio.Queue[SearchLog] = asyncio.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._pending: list[SearchLog] = []
+        self._task: asyncio.Task | None = None
+
+    def log(self, search_log: SearchLog):
+        try:
+            self.queue.put_nowait(search_log)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Search log queue full, {self.dropped} logs dropped")
+
+    def log_many(self, search_logs: list[SearchLog]):
+        for search_log in search_logs:
+            self.log(search_log)
+
+    async def _fill_pending(self):
+        """Move records into `_pending` until the batch is full or times out."""
+        self._pending.append(await self.queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_seconds
+        while len(self._pending) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                self._pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _flush(self, batch: list[SearchLog]):
+        async with AsyncSessionLocal_local_db() as db:
+            await log_search_queries(db, batch)
+        logger.debug(f"Flushed {len(batch)} search logs")
+
+    async def _run(self):
+        while True:
+            await self._fill_pending()
+            try:
+                await self._flush(self._pending)
+            except Exception as e:
+                self.dropped += len(self._pending)
+                logger.error(f"Error flushing search logs, {len(self._pending)} dropped: {e}")
+            # Cleared only afterwards, so close() re-sends a batch cut off mid-flush
+            self._pending = []
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the background task and write out whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        while self._pending or not self.queue.empty():
+            batch, self._pending = self._pending, []
+            while not self.queue.empty() and len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                lost = len(batch) + self.queue.qsize()
+                self.dropped += lost
+                logger.error(f"Error flushing search logs on shutdown, {lost} dropped: {e}")
+                return
+        if self.dropped:
+            logger.warning(f"{self.dropped} search logs were dropped")
+
+
+search_log_writer = SearchLogWriter(
+    max_size=SEARCH_LOG_QUEUE_SIZE,
+    batch_size=SEARCH_LOG_BATCH_SIZE,
+    flush_seconds=SEARCH_LOG_FLUSH_SECONDS,
+)
@@ -0,0 +1,353 @@
+import datetime
+import json
+import os
+import sys
+from collections import OrderedDict, deque
+
+from loguru import logger
+
+from db.redis_client import SESSION_REDIS_URL, get_redis
+
+SESSION_EXPIRY_MINUTES = 30
+SEARCH_HISTORY_SIZE = 5
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_SWEEP_SECONDS = int(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "redis" if SESSION_REDIS_URL else "memory").lower()
+REDIS_PREFIX = "ikmimart:session"
+
+
+class SessionExpired(Exception):
+    """The session is missing, expired, or was evicted from the store."""
+
+
+def get_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+def empty_totals() -> dict[str, int]:
+    return {"total_items": 0, "total_price": 0}
+
+
+class MemorySessionStore:
+    """Sessions and carts in a process-local LRU; only valid for a single worker.
+
+    Sessions are kept in access order, so idle-expiry and the size cap both
+    evict from the front of the dict. Cart changes on an evicted session
+    raise SessionExpired, the same as on an expired one.
+    """
+
+    def __init__(self, ttl: int, max_sessions: int):
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, dict] = OrderedDict()
+
+    def _get(self, session_id: str) -> dict | None:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        now = get_now()
+        if now - session["last_seen"] > self.ttl:
+            del self.sessions[session_id]
+            return None
+        session["last_seen"] = now
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _require(self, session_id: str) -> dict:
+        session = self._get(session_id)
+        if session is None:
+            raise SessionExpired(session_id)
+        return session
+
+    async def exists(self, session_id: str) -> bool:
+        return self._get(session_id) is not None
+
+    async def create(self, session_id: str):
+        now = get_now()
+        self.sessions[session_id] = {
+            "created_at": now,
+            "last_seen": now,
+            "cart": {},
+            "cart_totals": empty_totals(),
+            "search_history": deque(maxlen=SEARCH_HISTORY_SIZE),
+        }
+        while len(self.sessions) > self.max_sessions:
+            evicted, _ = self.sessions.popitem(last=False)
+            logger.debug(f"Session cap reached, evicted {evicted}")
+
+    async def touch(self, session_id: str):
+        self._get(session_id)
+
+    async def delete(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    async def sweep(self) -> int:
+        """Drop sessions idle for longer than the TTL; return how many went."""
+        cutoff = get_now() - self.ttl
+        expired = 0
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session["last_seen"] > cutoff:
+                break
+            del self.sessions[session_id]
+            expired += 1
+        return expired
+
+    def stats(self) -> dict[str, int]:
+        """Live session count and a rough estimate of the memory they hold."""
+        size = sys.getsizeof(self.sessions)
+        for session_id, session in self.sessions.items():
+            size += sys.getsizeof(session_id) + sys.getsizeof(session)
+            size += sys.getsizeof(session["cart"])
+            size += sum(sys.getsizeof(item) for item in session["cart"].values())
+            size += sys.getsizeof(session["search_history"])
+            size += sum(sys.getsizeof(q) for q in session["search_history"])
+        return {"sessions": len(self.sessions), "bytes": size}
+
+    async def get_cart(self, session_id: str) -> dict[int, dict]:
+        session = self._get(session_id)
+        return {pid: dict(item) for pid, item in session["cart"].items()} if session else {}
+
+    async def cart_totals(self, session_id: str) -> dict[str, int]:
+        session = self._get(session_id)
+        return dict(session["cart_totals"]) if session else empty_totals()
+
+    async def add_to_cart(
+        self, session_id: str, product: dict
+    ) -> tuple[dict, dict[str, int]]:
+        """Add one of `product`; its price is snapshotted on first add."""
+        session = self._require(session_id)
+        item = session["cart"].setdefault(product["id"], {**product, "qty": 0})
+        item["qty"] += 1
+        item["updated_at"] = get_now()
+        totals = session["cart_totals"]
+        totals["total_items"] += 1
+        totals["total_price"] += item["price"]
+        return dict(item), dict(totals)
+
+    async def change_qty(
+        self, session_id: str, product_id: int, delta: int
+    ) -> tuple[dict | None, dict[str, int]]:
+        """Add `delta` to an item's quantity, never going below 1."""
+        session = self._require(session_id)
+        totals = session["cart_totals"]
+        item = session["cart"].get(product_id)
+        if item is None:
+            return None, dict(totals)
+        qty = max(1, item["qty"] + delta)
+        totals["total_items"] += qty - item["qty"]
+        totals["total_price"] += (qty - item["qty"]) * item["price"]
+        item["qty"] = qty
+        return dict(item), dict(totals)
+
+    async def remove_from_cart(self, session_id: str, product_id: int) -> dict[str, int]:
+        session = self._require(session_id)
+        totals = session["cart_totals"]
+        item = session["cart"].pop(product_id, None)
+        if item is not None:
+            totals["total_items"] -= item["qty"]
+            totals["total_price"] -= item["qty"] * item["price"]
+        return dict(totals)
+
+    async def clear_cart(self, session_id: str):
+        session = self._require(session_id)
+        session["cart"] = {}
+        session["cart_totals"] = empty_totals()
+
+    async def push_search(self, session_id: str, keyword: str):
+        session = self._get(session_id)
+        # Evicted mid-request: the search still answers, the history is lost
+        if session is not None:
+            session["search_history"].append(keyword)
+
+    async def search_history(self, session_id: str) -> list[str]:
+        session = self._get(session_id)
+        return list(session["search_history"]) if session else []
+
+
+# Cart mutations run as scripts so the item and the running totals change
+# atomically. KEYS = cart, cart_totals, meta; the cart hash maps product_id
+# to a JSON item holding the snapshotted price. Each returns the JSON item (or
+# '') followed by total_items and total_price, or nil when the session's meta
+# hash is gone, so an expired session's cart is never recreated.
+ADD_TO_CART_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 0 then return nil end
+local item = redis.call('HGET', KEYS[1], ARGV[1])
+if item then item = cjson.decode(item) else item = cjson.decode(ARGV[2]) end
+item['qty'] = item['qty'] + 1
+item['updated_at'] = tonumber(ARGV[3])
+local price = item['price']
+item = cjson.encode(item)
+redis.call('HSET', KEYS[1], ARGV[1], item)
+redis.call('HINCRBY', KEYS[2], 'total_items', 1)
+redis.call('HINCRBY', KEYS[2], 'total_price', price)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+local totals = redis.call('HMGET', KEYS[2], 'total_items', 'total_price')
+return {item, totals[1], totals[2]}
+"""
+CHANGE_QTY_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 0 then return nil end
+local item = redis.call('HGET', KEYS[1], ARGV[1])
+if item then
+    item = cjson.decode(item)
+    local qty = math.max(1, item['qty'] + tonumber(ARGV[2]))
+    local diff = qty - item['qty']
+    local price = item['price']
+    item['qty'] = qty
+    item = cjson.encode(item)
+    redis.call('HSET', KEYS[1], ARGV[1], item)
+    redis.call('HINCRBY', KEYS[2], 'total_items', diff)
+    redis.call('HINCRBY', KEYS[2], 'total_price', diff * price)
+else
+    item = ''
+end
+local totals = redis.call('HMGET', KEYS[2], 'total_items', 'total_price')
+return {item, totals[1] or '0', totals[2] or '0'}
+"""
+REMOVE_FROM_CART_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 0 then return nil end
+local item = redis.call('HGET', KEYS[1], ARGV[1])
+if item then
+    item = cjson.decode(item)
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('HINCRBY', KEYS[2], 'total_items', -item['qty'])
+    redis.call('HINCRBY', KEYS[2], 'total_price', -item['qty'] * item['price'])
+end
+local totals = redis.call('HMGET', KEYS[2], 'total_items', 'total_price')
+return {'', totals[1] or '0', totals[2] or '0'}
+"""
+
+
+class RedisSessionStore:
+    """Sessions shared by all workers; every key expires with the session cookie.
+
+    Per session: a meta hash, a cart hash of product_id -> JSON item, a hash
+    with the cart's running totals, and a capped search-history list.
+    """
+
+    def __init__(self, client, ttl: int):
+        self.client = client
+        self.ttl = ttl
+        self._add_to_cart = client.register_script(ADD_TO_CART_LUA)
+        self._change_qty = client.register_script(CHANGE_QTY_LUA)
+        self._remove_from_cart = client.register_script(REMOVE_FROM_CART_LUA)
+
+    def _keys(self, session_id: str) -> tuple[str, str, str, str]:
+        base = f"{REDIS_PREFIX}:{session_id}"
+        return base, f"{base}:cart", f"{base}:cart_totals", f"{base}:history"
+
+    async def exists(self, session_id: str) -> bool:
+        return bool(await self.client.exists(self._keys(session_id)[0]))
+
+    async def create(self, session_id: str):
+        meta, *_ = self._keys(session_id)
+        await self.client.hset(meta, mapping={"created_at": get_now().isoformat()})
+        await self.client.expire(meta, self.ttl)
+
+    async def touch(self, session_id: str):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in self._keys(session_id):
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def delete(self, session_id: str):
+        await self.client.delete(*self._keys(session_id))
+
+    async def sweep(self) -> int:
+        # Redis expires the keys itself
+        return 0
+
+    def stats(self) -> dict[str, int]:
+        return {}
+
+    @staticmethod
+    def _load_item(raw: bytes) -> dict:
+        item = json.loads(raw)
+        item["updated_at"] = datetime.datetime.fromtimestamp(
+            item["updated_at"], datetime.UTC
+        )
+        return item
+
+    @classmethod
+    def _parse(cls, session_id: str, result: list | None) -> tuple[dict | None, dict[str, int]]:
+        if result is None:
+            raise SessionExpired(session_id)
+        raw, total_items, total_price = result
+        item = cls._load_item(raw) if raw else None
+        return item, {"total_items": int(total_items), "total_price": int(total_price)}
+
+    async def get_cart(self, session_id: str) -> dict[int, dict]:
+        cart = await self.client.hgetall(self._keys(session_id)[1])
+        return {int(product_id): self._load_item(raw) for product_id, raw in cart.items()}
+
+    async def cart_totals(self, session_id: str) -> dict[str, int]:
+        total_items, total_price = await self.client.hmget(
+            self._keys(session_id)[2], "total_items", "total_price"
+        )
+        return {"total_items": int(total_items or 0), "total_price": int(total_price or 0)}
+
+    async def add_to_cart(
+        self, session_id: str, product: dict
+    ) -> tuple[dict, dict[str, int]]:
+        """Add one of `product`; its price is snapshotted on first add."""
+        meta, cart, cart_totals, _ = self._keys(session_id)
+        result = await self._add_to_cart(
+            keys=[cart, cart_totals, meta],
+            args=[
+                product["id"],
+                json.dumps({**product, "qty": 0}),
+                get_now().timestamp(),
+                self.ttl,
+            ],
+        )
+        return self._parse(session_id, result)
+
+    async def change_qty(
+        self, session_id: str, product_id: int, delta: int
+    ) -> tuple[dict | None, dict[str, int]]:
+        """Add `delta` to an item's quantity, never going below 1."""
+        meta, cart, cart_totals, _ = self._keys(session_id)
+        result = await self._change_qty(
+            keys=[cart, cart_totals, meta], args=[product_id, delta]
+        )
+        return self._parse(session_id, result)
+
+    async def remove_from_cart(self, session_id: str, product_id: int) -> dict[str, int]:
+        meta, cart, cart_totals, _ = self._keys(session_id)
+        result = await self._remove_from_cart(
+            keys=[cart, cart_totals, meta], args=[product_id]
+        )
+        return self._parse(session_id, result)[1]
+
+    async def clear_cart(self, session_id: str):
+        _, cart, cart_totals, _ = self._keys(session_id)
+        await self.client.delete(cart, cart_totals)
+
+    async def push_search(self, session_id: str, keyword: str):
+        history = self._keys(session_id)[3]
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(history, keyword)
+            pipe.ltrim(history, -SEARCH_HISTORY_SIZE, -1)
+            pipe.expire(history, self.ttl)
+            await pipe.execute()
+
+    async def search_history(self, session_id: str) -> list[str]:
+        history = await self.client.lrange(self._keys(session_id)[3], 0, -1)
+        return [keyword.decode() for keyword in history]
+
+
+def create_session_store():
+    if SESSION_BACKEND == "redis":
+        client = get_redis(SESSION_REDIS_URL)
+        if client is None:
+            raise ValueError(
+                "SESSION_BACKEND=redis requires SESSION_REDIS_URL or REDIS_URL to be set."
+            )
+        return RedisSessionStore(client, ttl=SESSION_EXPIRY_MINUTES * 60)
+    return MemorySessionStore(
+        ttl=SESSION_EXPIRY_MINUTES * 60, max_sessions=SESSION_MAX_COUNT
+    )
+
+
+session_store = create_session_store()
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import re
+from pathlib import Path
+
+import brotli
+from loguru import logger
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+STATIC_DIR = Path("static")
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+TEMPLATES_DIR = Path("templates")
+CONTENT_DIRS = (TEMPLATES_DIR, STATIC_DIR / "js")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Logical asset name -> the source files concatenated into it
+ASSETS = {
+    # tailwind.min.css is the full prebuilt v2 build; app.css adds the few
+    # newer utilities the templates use that it does not have
+    "css/tailwind.css": ["css/tailwind.min.css", "css/app.css"],
+    "js/htmx.min.js": ["js/htmx.min.js"],
+    "js/script.js": ["js/script.js"],
+}
+PRUNED_ASSETS = {"css/tailwind.css"}
+
+_CLASS_IN_SELECTOR = re.compile(r"\.((?:\\.|[\w-])+)")
+_CANDIDATE = re.compile(r"[^\s\"'`<>={}%]+")
+
+_manifest: dict[str, str] | None = None
+_fingerprint: str | None = None
+
+
+def used_tokens() -> set[str]:
+    """Every word that could be a class name in the templates and scripts.
+
+    Over-matching only keeps a few unused rules; under-matching would drop
+    styles, so this is a plain scan like Tailwind's own content scanner.
+    """
+    tokens = set()
+    for directory in CONTENT_DIRS:
+        for path in directory.rglob("*"):
+            if path.suffix in (".html", ".js"):
+                tokens.update(_CANDIDATE.findall(path.read_text(encoding="utf-8")))
+    return tokens
+
+
+def _selector_used(selector: str, tokens: set[str]) -> bool:
+    classes = [re.sub(r"\\(.)", r"\1", c) for c in _CLASS_IN_SELECTOR.findall(selector)]
+    return all(c in tokens for c in classes)
+
+
+def _split_blocks(css: str) -> list[tuple[str, str]]:
+    """Split a stylesheet into top-level (prelude, body) pairs."""
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = ""
+    for i, char in enumerate(css):
+        if char == "{":
+            if depth == 0:
+                prelude = css[start:i].strip()
+                start = i + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude, css[start:i]))
+                start = i + 1
+    return blocks
+
+
+def prune_css(css: str, tokens: set[str]) -> str:
+    """Drop rules whose selectors need a class that is never used."""
+    licences = dict.fromkeys(re.findall(r"/\*!\s*[^*\s].*?\*/", css, flags=re.S))
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return "".join(licences) + _prune_rules(css, tokens)
+
+
+def _prune_rules(css: str, tokens: set[str]) -> str:
+    out = []
+    keyframes = []
+    for prelude, body in _split_blocks(css):
+        if prelude.startswith("@media"):
+            inner = _prune_rules(body, tokens)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@keyframes"):
+            keyframes.append((prelude, body))
+        elif prelude.startswith("@"):
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            kept = [s for s in prelude.split(",") if _selector_used(s, tokens)]
+            if kept:
+                out.append(f"{','.join(kept)}{{{body}}}")
+    pruned = "".join(out)
+    for prelude, body in keyframes:
+        if prelude.split()[-1] in pruned:
+            pruned += f"{prelude}{{{body}}}"
+    return pruned
+
+
+def build_assets() -> dict[str, str]:
+    """Write fingerprinted assets plus .gz/.br siblings and the manifest."""
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    tokens = used_tokens()
+    manifest = {}
+    for name, sources in ASSETS.items():
+        content = "\n".join(
+            (STATIC_DIR / source).read_text(encoding="utf-8") for source in sources
+        )
+        if name in PRUNED_ASSETS:
+            content = prune_css(content, tokens)
+        data = content.encode()
+        digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+        path = Path(name)
+        hashed = DIST_DIR / path.parent / f"{path.stem}.{digest}{path.suffix}"
+        hashed.parent.mkdir(parents=True, exist_ok=True)
+        hashed.write_bytes(data)
+        hashed.with_name(hashed.name + ".gz").write_bytes(gzip.compress(data, 9))
+        hashed.with_name(hashed.name + ".br").write_bytes(brotli.compress(data))
+        manifest[name] = hashed.relative_to(STATIC_DIR).as_posix()
+        logger.info(f"{name} -> {manifest[name]} ({len(data)} bytes)")
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def get_manifest() -> dict[str, str]:
+    global _manifest
+    if _manifest is None:
+        if MANIFEST_PATH.exists():
+            _manifest = json.loads(MANIFEST_PATH.read_text())
+        else:
+            # Not built yet (e.g. a dev checkout): build on first use
+            _manifest = build_assets()
+    return _manifest
+
+
+def asset_url(name: str) -> str:
+    """Template helper: the fingerprinted URL of a logical asset."""
+    return f"/static/{get_manifest()[name]}"
+
+
+def build_fingerprint() -> str:
+    """Digest of the asset manifest and the templates of this build.
+
+    Part of every catalog ETag and fragment cache key, so a deploy that
+    changes markup or asset URLs is not answered with the previous build's
+    responses.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(json.dumps(get_manifest(), sort_keys=True).encode())
+        for path in sorted(TEMPLATES_DIR.rglob("*.html")):
+            digest.update(path.as_posix().encode())
+            digest.update(path.read_bytes())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serve fingerprinted files with their .br/.gz sibling and immutable caching."""
+
+    async def get_response(self, path: str, scope) -> FileResponse:
+        response = await super().get_response(path, scope)
+        if response.status_code != 200:
+            return response
+        headers = dict(scope["headers"])
+        accept_encoding = headers.get(b"accept-encoding", b"").decode()
+        full_path, _ = self.lookup_path(path)
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            sibling = Path(full_path + suffix) if full_path else None
+            if encoding in accept_encoding and sibling is not None and sibling.exists():
+                response = FileResponse(
+                    sibling,
+                    media_type=response.media_type,
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+                )
+                break
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import os
+import re
+import time
+from collections import Counter, deque
+
+from loguru import logger
+from rapidfuzz import fuzz, process
+from sqlalchemy import text
+
+from db.database import AsyncSessionLocal_local_db
+from services.db_services import read_frame
+from services.metrics import stage_timer
+
+TOP_QUERIES_REFRESH_SECONDS = int(os.getenv("TOP_QUERIES_REFRESH_SECONDS", "60"))
+TOP_QUERIES_WINDOW_DAYS = 14
+TOP_QUERIES_SIZE = 50
+CLUSTER_SCORE_CUTOFF = 85
+# Search logs are written in batches by several workers, so ids can become
+# visible out of order; rows this recent are re-read and de-duplicated by id
+TOP_QUERIES_OVERLAP_SECONDS = int(os.getenv("TOP_QUERIES_OVERLAP_SECONDS", "300"))
+
+NEW_LOGS_QUERY = text("""
+    SELECT id, query, searched_at
+    FROM search_logs
+    WHERE id > :floor
+      AND searched_at > NOW() - make_interval(days => :window_days)
+      AND items_found BETWEEN 1 AND 10
+    ORDER BY id
+""")
+
+_QUERY_PATTERN = re.compile(r"^[a-zA-Z0-9 ]+$")
+
+
+def normalize_query(query: str) -> str | None:
+    """Apply the top-queries filter; None means the query is not counted."""
+    if len(query) < 4 or not _QUERY_PATTERN.match(query):
+        return None
+    query = query.strip().lower().replace("  ", " ")
+    return query or None
+
+
+class QueryClusters:
+    """Fuzzy clusters of recent search queries, maintained incrementally.
+
+    A new distinct query joins the cluster of its closest known query when
+    they score above CLUSTER_SCORE_CUTOFF, otherwise it starts a cluster of
+    its own. Counts are bucketed per day so the window can slide forward by
+    dropping whole days instead of re-reading the logs.
+
+    Reads start above `floor`, the highest id seen TOP_QUERIES_OVERLAP_SECONDS
+    ago rather than the highest id seen so far, so a batch that commits after
+    a later one is still picked up; `seen` keeps ids above the floor from
+    being counted twice.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.floor = 0
+        self.seen: set[int] = set()
+        self._marks: deque[tuple[float, int]] = deque()
+        self.daily: dict[datetime.date, Counter] = {}
+        self.counts: Counter = Counter()
+        self.cluster_of: dict[str, int] = {}
+        self.members: dict[int, set[str]] = {}
+        self._next_cluster = 0
+
+    def add(self, rows: list[tuple[int, str, datetime.datetime]]):
+        for log_id, query, searched_at in rows:
+            if log_id <= self.floor or log_id in self.seen:
+                continue
+            self.seen.add(log_id)
+            self.last_id = max(self.last_id, log_id)
+            query = normalize_query(query)
+            if query is None:
+                continue
+            self.daily.setdefault(searched_at.date(), Counter())[query] += 1
+            self.counts[query] += 1
+            if query not in self.cluster_of:
+                self._assign(query)
+
+    def advance(self, now: float):
+        """Record this refresh's high-water mark and raise the floor past old ones."""
+        self._marks.append((now, self.last_id))
+        while self._marks and self._marks[0][0] <= now - TOP_QUERIES_OVERLAP_SECONDS:
+            self.floor = self._marks.popleft()[1]
+        self.seen = {log_id for log_id in self.seen if log_id > self.floor}
+
+    def _assign(self, query: str):
+        match = process.extractOne(
+            query, list(self.cluster_of), scorer=fuzz.token_sort_ratio
+        )
+        if match and match[1] > CLUSTER_SCORE_CUTOFF:
+            cluster = self.cluster_of[match[0]]
+        else:
+            cluster = self._next_cluster
+            self._next_cluster += 1
+            self.members[cluster] = set()
+        self.cluster_of[query] = cluster
+        self.members[cluster].add(query)
+
+    def expire(self, oldest: datetime.date):
+        """Forget every day before `oldest`."""
+        for day in [day for day in self.daily if day < oldest]:
+            for query, count in self.daily.pop(day).items():
+                self.counts[query] -= count
+                if self.counts[query] > 0:
+                    continue
+                del self.counts[query]
+                cluster = self.cluster_of.pop(query)
+                self.members[cluster].discard(query)
+                if not self.members[cluster]:
+                    del self.members[cluster]
+
+    def top(self, top_n: int) -> list[tuple[str, int]]:
+        results = [
+            (max(group, key=len), sum(self.counts[q] for q in group))
+            for group in self.members.values()
+        ]
+        return sorted(results, key=lambda x: x[1], reverse=True)[:top_n]
+
+
+_clusters = QueryClusters()
+_top_queries: list[tuple[str, int]] = []
+
+
+async def refresh_top_queries():
+    """Fold search logs committed since the last refresh into the clusters."""
+    global _top_queries
+    async with AsyncSessionLocal_local_db() as db:
+        df = await read_frame(
+            db,
+            NEW_LOGS_QUERY,
+            {"floor": _clusters.floor, "window_days": TOP_QUERIES_WINDOW_DAYS},
+        )
+
+    @stage_timer("top_queries_clustering")
+    def _update() -> list[tuple[str, int]]:
+        if not df.is_empty():
+            _clusters.add(df.iter_rows())
+        _clusters.advance(time.monotonic())
+        today = datetime.datetime.now(datetime.UTC).date()
+        _clusters.expire(today - datetime.timedelta(days=TOP_QUERIES_WINDOW_DAYS))
+        return _clusters.top(TOP_QUERIES_SIZE)
+
+    # Clustering is CPU-bound, keep it off the event loop
+    _top_queries = await asyncio.to_thread(_update)
+    logger.debug(f"Top queries refreshed ({df.height} new logs)")
+
+
+async def top_queries_refresher():
+    while True:
+        await asyncio.sleep(TOP_QUERIES_REFRESH_SECONDS)
+        try:
+            await refresh_top_queries()
+        except Exception as e:
+            logger.error(f"Error refreshing top queries: {e}")
+
+
+def get_top_queries(top_n: int = 15) -> list[tuple[str, int]]:
+    return _top_queries[:top_n]